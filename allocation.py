@@ -0,0 +1,108 @@
+# allocation.py
+"""Integer sample allocation over many strata at once.
+
+Every allocation here is a matrix problem: each row of `weights` is split
+into integers summing exactly to that row's total (Hamilton's largest
+remainder method), so a whole Group x STATU_CAT x status table is allocated
+in one NumPy call.
+"""
+import numpy as np
+
+from instrumentation import instrumented
+from utils import SamplingError
+
+ALLOCATION_METHODS = ('proportional', 'neyman')
+
+
+def largest_remainder(quotas, totals):
+    """Round each row of `quotas` to integers that sum exactly to `totals`.
+
+    Cells are floored, then the shortfall goes one unit each to the cells
+    with the largest fractional parts (ties go to the earlier cell).
+    """
+    quotas = np.atleast_2d(np.asarray(quotas, dtype=float))
+    totals = np.broadcast_to(np.asarray(totals, dtype=np.int64), quotas.shape[:1])
+    floors = np.floor(quotas).astype(np.int64)
+    shortfall = totals - floors.sum(axis=1)
+
+    order = np.argsort(floors - quotas, axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(quotas.shape[1]), order.shape), axis=1)
+    return floors + (ranks < shortfall[:, None])
+
+
+def _split(weights, totals, minimum):
+    """Guaranteed minimum per cell, continuous quotas of the rest, and the rest per row."""
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    totals = np.broadcast_to(np.asarray(totals, dtype=np.int64), weights.shape[:1])
+    if (weights < 0).any() or not np.isfinite(weights).all():
+        raise SamplingError("Allocation weights must be finite and non-negative.")
+    if (totals < 0).any():
+        raise SamplingError("Allocation totals must be non-negative.")
+
+    positive = weights > 0
+    row_weight = weights.sum(axis=1)
+    totals = np.where(row_weight > 0, totals, 0)
+
+    floor = np.zeros(weights.shape, dtype=np.int64)
+    if minimum:
+        per_cell = np.minimum(minimum, totals // np.maximum(positive.sum(axis=1), 1))
+        floor = np.where(positive, per_cell[:, None], 0)
+    remaining = totals - floor.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        quotas = np.where(row_weight[:, None] > 0, weights / row_weight[:, None], 0) * remaining[:, None]
+    return floor, quotas, remaining
+
+
+def allocate(weights, totals, minimum=0):
+    """Split each row's total over its cells in proportion to `weights`, exactly.
+
+    `weights` is (strata, cells) or a single row; `totals` one integer per
+    row. With `minimum`, every cell of positive weight first gets that many
+    units (fewer if the row total cannot cover it) and the rest is
+    allocated proportionally. Rows whose weights are all zero get nothing.
+    """
+    floor, quotas, remaining = _split(weights, totals, minimum)
+    return floor + largest_remainder(quotas, remaining)
+
+
+def allocation_quotas(weights, totals, minimum=0):
+    """The exact (fractional) allocation that `allocate` rounds, for measuring rounding error."""
+    floor, quotas, _ = _split(weights, totals, minimum)
+    return floor + quotas
+
+
+def allocation_weights(sizes, method='proportional', dispersion=None):
+    """Allocation weights per stratum: N_h (proportional) or N_h * S_h (Neyman)."""
+    sizes = np.asarray(sizes, dtype=float)
+    if method == 'proportional':
+        return sizes
+    if method == 'neyman':
+        if dispersion is None:
+            raise SamplingError("Neyman allocation needs a dispersion (standard deviation) per stratum.")
+        return sizes * np.nan_to_num(np.asarray(dispersion, dtype=float))
+    raise SamplingError(f"Unknown allocation method: {method}. Expected one of {', '.join(ALLOCATION_METHODS)}.")
+
+
+@instrumented
+def allocate_frame(population_distribution, total_sample_size, interviews_per_neighborhood,
+                   method='proportional', dispersion=None, min_per_stratum=0):
+    """Sampling frame columns for a population distribution (one row per Group).
+
+    Sample_Size splits `total_sample_size` over the Groups, Neighborhood_Count
+    is ceil(Sample_Size / interviews_per_neighborhood), and each Group's
+    neighborhoods are split between BŞ and M&D by population. Every split
+    sums exactly to its total.
+    """
+    frame = population_distribution.copy()
+    weights = allocation_weights(frame['Total_Pop'].to_numpy(), method, dispersion)
+    frame['Sample_Size'] = allocate(weights, total_sample_size, minimum=min_per_stratum)[0]
+    frame['Neighborhood_Count'] = -(-frame['Sample_Size'] // interviews_per_neighborhood)
+
+    by_status = np.column_stack([frame[col].to_numpy() if col in frame.columns else np.zeros(len(frame))
+                                 for col in ('BŞ', 'M&D')])
+    split = allocate(by_status, frame['Neighborhood_Count'].to_numpy())
+    frame['Neighborhood_BŞ'] = split[:, 0]
+    frame['Neighborhood_M&D'] = split[:, 1]
+    return frame
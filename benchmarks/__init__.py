@@ -0,0 +1,12 @@
+# benchmarks/__init__.py
+import time
+
+
+def best_of(fn, repeat):
+    """Best wall time of `repeat` calls to `fn`, and the result of the last call."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
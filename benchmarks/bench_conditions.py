@@ -0,0 +1,59 @@
+# benchmarks/bench_conditions.py
+"""Per-rule string parsing vs the compiled single-pass plan for special_adjustments.
+
+Usage: python -m benchmarks.bench_conditions [--rows 1000000] [--rules 2 20 80] [--repeat 3]
+"""
+import argparse
+
+import pandas as pd
+
+from benchmarks import best_of
+from benchmarks.synthetic_adnks import PROVINCES, generate_adnks
+from conditions import adjustment_populations
+from data_loader import compact_frame, normalize_columns
+from utils import assign_groups, classify_statuses, load_config
+
+
+def legacy_adjustments(df, config):
+    """The original loop: re-split each condition and scan the frame once per equality."""
+    adjustments = {}
+    for adj in config['special_adjustments']:
+        col_map = {v: k for k, v in config['columns'].items()}
+        mask = pd.Series(True, index=df.index)
+        for part in adj['condition'].split(' and '):
+            field, value = part.split('==')
+            mask &= df[col_map.get(field.strip(), field.strip())] == value.strip().strip("'").strip('"')
+        adjustments[adj['stratum']] = df[mask]['population'].sum()
+    return adjustments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--rules', type=int, nargs='+', default=[2, 20, 80])
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    df = normalize_columns(generate_adnks(args.rows), config)
+    df['STATU_CAT'] = classify_statuses(df['status'])
+    df['Group'] = assign_groups(df)
+    df = compact_frame(df, config)
+    provinces = [name for name, _, _, _ in PROVINCES.values()]
+
+    print(f"{args.rows} rows")
+    print(f"{'rules':>6}{'legacy':>12}{'compiled':>12}{'speedup':>10}")
+    for n_rules in args.rules:
+        rules = [{'stratum': f"R{i}", 'action': 'add_population',
+                  'condition': f"IL == '{provinces[i % len(provinces)]}' and ILCE == 'Merkez' and STATU_CAT == 'M&D'"}
+                 for i in range(n_rules)]
+        rule_config = {**config, 'special_adjustments': rules}
+        t_legacy, legacy = best_of(lambda: legacy_adjustments(df, rule_config), args.repeat)
+        t_compiled, compiled = best_of(lambda: adjustment_populations(df, rule_config), args.repeat)
+        assert {k: int(v) for k, v in legacy.items()} == compiled, "adjustment totals differ"
+        print(f"{n_rules:>6}{t_legacy * 1000:>10.1f}ms{t_compiled * 1000:>10.1f}ms{t_legacy / t_compiled:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
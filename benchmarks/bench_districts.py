@@ -0,0 +1,85 @@
+# benchmarks/bench_districts.py
+"""Per-cell district loop vs the one-pass two-stage draw for the Phase 3 Other strata.
+
+Usage: python -m benchmarks.bench_districts [--base-size 1000] [--scales 1 10 100] [--districts 1 5 20] [--repeat 5]
+"""
+import argparse
+
+import numpy as np
+
+from allocation import allocate
+from benchmarks import best_of
+from data_cache import load_cached_data
+from phase3_sampler import draw_other_positions
+from pps_sampler import pps_sample_rows
+from sampling_frame import create_population_distribution, compute_sampling_frame
+from stratum_index import build_stratum_index, stratum_children, stratum_population, stratum_rows
+from utils import load_config
+
+
+def legacy_other_positions(index, sampling_frame, weights, rng):
+    """The previous draw: a Python loop over Group x ILCE_STATU cells, one district per cell.
+
+    ILCE_STATU 1 took the first district in dataset order; ILCE_STATU 2 made
+    one rng.choice per cell. Districts are (nuts3, district) pairs, as in
+    the current index.
+    """
+    other_strata = sampling_frame[sampling_frame['Neighborhood_M&D'] > 0]
+    other_strata = other_strata[[len(stratum_rows(index, group, 'M&D')) > 0 for group in other_strata['Group']]]
+    groups = other_strata['Group'].tolist()
+    status_pop = np.array([[stratum_population(index, group, 'M&D', ilce_status) for ilce_status in (1, 2)]
+                           for group in groups], dtype=float).reshape(len(groups), 2)
+    status_alloc = allocate(status_pop, other_strata['Neighborhood_M&D'].astype(int).to_numpy())
+
+    row_groups, sizes = [], []
+    for group, neigh_alloc in zip(groups, status_alloc):
+        for i, ilce_status in enumerate([1, 2]):
+            districts = [(nuts3, district) for nuts3 in stratum_children(index, group, 'M&D', ilce_status)
+                         for district in stratum_children(index, group, 'M&D', ilce_status, nuts3)]
+            if len(districts) == 0:
+                continue
+            if ilce_status == 1:
+                district = min(districts, key=lambda d: stratum_rows(index, group, 'M&D', ilce_status, *d).min())
+            else:
+                pop = np.array([stratum_population(index, group, 'M&D', ilce_status, *d) for d in districts],
+                               dtype=float)
+                district = districts[rng.choice(len(districts), p=pop / pop.sum())]
+            if neigh_alloc[i]:
+                row_groups.append(stratum_rows(index, group, 'M&D', ilce_status, *district))
+                sizes.append(neigh_alloc[i])
+    return pps_sample_rows(row_groups, sizes, weights, rng)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='ADNKS_2023.xlsx')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--base-size', type=int, default=1000)
+    parser.add_argument('--per-neighborhood', type=int, default=10)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--districts', type=int, nargs='+', default=[1, 5, 20], help="Districts per cell.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    df = load_cached_data(args.data, config)
+    index = build_stratum_index(df)
+    weights = df['population'].to_numpy()
+    population_distribution = create_population_distribution(df, config)
+    print(f"{len(df)} rows")
+
+    print(f"{'sample size':>12}{'districts':>10}{'drawn':>8}{'loop':>12}{'two-stage':>12}{'speedup':>10}")
+    for scale in args.scales:
+        frame = compute_sampling_frame(population_distribution, args.base_size * scale, args.per_neighborhood)
+        t_loop, _ = best_of(lambda: legacy_other_positions(index, frame, weights, np.random.default_rng(42)),
+                            args.repeat)
+        for districts in args.districts:
+            t_new, (positions, _) = best_of(lambda: draw_other_positions(index, frame, weights,
+                                                                         np.random.default_rng(42),
+                                                                         districts_per_cell=districts), args.repeat)
+            print(f"{args.base_size * scale:>12}{districts:>10}{len(positions):>8}{t_loop * 1000:>10.1f}ms"
+                  f"{t_new * 1000:>10.1f}ms{t_loop / t_new:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# benchmarks/bench_grouping.py
+"""Row-wise vs vectorized Group/STATU_CAT assignment on the full ADNKS file.
+
+Usage: python -m benchmarks.bench_grouping [--data ADNKS_2023.xlsx] [--repeat 5]
+"""
+import argparse
+
+import pandas as pd
+
+from benchmarks import best_of
+from data_loader import normalize_columns
+from utils import load_config, assign_group, assign_groups, classify_statut, classify_statuses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='ADNKS_2023.xlsx')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    df = normalize_columns(pd.read_excel(args.data, engine='openpyxl'), config)
+    df = df.dropna(subset=list(config['columns'].keys()))
+    print(f"{len(df)} rows")
+
+    t_row_status, row_status = best_of(lambda: df['status'].apply(classify_statut), args.repeat)
+    t_vec_status, vec_status = best_of(lambda: classify_statuses(df['status']), args.repeat)
+    assert row_status.astype(object).equals(vec_status.astype(object)), "STATU_CAT mismatch"
+
+    t_row_group, row_group = best_of(lambda: df.apply(assign_group, axis=1), args.repeat)
+    t_vec_group, vec_group = best_of(lambda: assign_groups(df), args.repeat)
+    assert row_group.astype(object).equals(vec_group.astype(object)), "Group mismatch"
+
+    print(f"{'step':<12}{'row-wise':>12}{'vectorized':>12}{'speedup':>10}")
+    for name, slow, fast in [('STATU_CAT', t_row_status, t_vec_status), ('Group', t_row_group, t_vec_group)]:
+        print(f"{name:<12}{slow * 1000:>10.1f}ms{fast * 1000:>10.1f}ms{slow / fast:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_imports.py
+"""Cold import time of the app and CLI entry points, measured with `python -X importtime`.
+
+Usage: python -m benchmarks.bench_imports [--repeat 5] [--top 10] [--json import_times.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# What each entry point imports before it can do anything. main.py is a Streamlit script, and every tab body
+# runs on every rerun, so the app target renders its first page headlessly (AppTest) rather than importing
+# a module list; that includes imports inside functions the render calls, plus AppTest's own.
+TARGETS = {
+    'app': f"from streamlit.testing.v1 import AppTest; AppTest.from_file({str(ROOT / 'main.py')!r}, "
+           "default_timeout=600).run()",
+    'pipeline': "import pipeline",
+    'replication': "import replication",
+    'data_cache': "import data_cache",
+}
+# Dependencies that should only load when the feature needing them is used (a module and its submodules).
+# Streamlit imports plotly itself, so only plotly.express, which the app's charts import, is listed.
+DEFERRED = ('plotly.express', 'openpyxl', 'xlsxwriter', 'yaml', 'phase2_neighborhood_selection', 'phase3_sampler')
+
+
+def is_deferred(name):
+    return any(name == module or name.startswith(f"{module}.") for module in DEFERRED)
+
+
+def import_profile(statement):
+    """One fresh interpreter: {module: (self_us, cumulative_us)} plus the total wall time in microseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            capture_output=True, text=True, check=True, cwd=ROOT)
+    modules, total = {}, 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # top-level entries are not indented
+            total += int(cumulative_us)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', nargs='+', default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="List the N slowest imports of each target.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for target in args.targets:
+        runs = [import_profile(TARGETS[target]) for _ in range(args.repeat)]
+        modules, total = min(runs, key=lambda run: run[1])
+        deferred = sorted(name for name in modules if is_deferred(name))
+        slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        report[target] = {
+            'total_ms': total / 1000,
+            'modules': len(modules),
+            'deferred_loaded': sorted({module for module in DEFERRED for name in deferred
+                                       if name == module or name.startswith(f"{module}.")}),
+            'slowest_self_ms': {name: self_us / 1000 for name, (self_us, _) in slowest},
+        }
+
+        print(f"{target}: {total / 1000:.1f}ms, {len(modules)} modules (best of {args.repeat})")
+        if deferred:
+            print(f"  loaded eagerly: {', '.join(report[target]['deferred_loaded'])}")
+        for name, self_ms in report[target]['slowest_self_ms'].items():
+            print(f"  {self_ms:>8.1f}ms  {name}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'targets': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_phase2.py
+"""Row-wise GroupLabel and pandas export vs hashed membership and streamed export for Phase 2.
+
+Usage: python -m benchmarks.bench_phase2 [--metropol m.csv --other o.csv] [--scales 1 10 100] [--repeat 3]
+    [--strings]
+
+Without province lists, the dataset's provinces are split alternately
+between Metropol and Other. Each scale tiles the full dataset that many
+times. The cached frame is categorical, where pandas already applies the
+old lambda once per category; --strings benchmarks plain string columns,
+where it ran once per row.
+"""
+import argparse
+import os
+import tempfile
+
+import pandas as pd
+
+from benchmarks import best_of
+from data_cache import load_cached_data
+from phase2_neighborhood_selection import (
+    export_neighborhood_codes, filter_by_nuts3, read_nuts3_codes, selection_summary,
+)
+from utils import load_config
+
+
+def legacy_filter(df, metropol_nuts3, other_nuts3):
+    """The original filter: a set lookup for the rows, then a Python lambda per row for GroupLabel."""
+    filtered = df[df['nuts3'].isin(set(metropol_nuts3 + other_nuts3))].copy()
+    filtered['GroupLabel'] = filtered['nuts3'].apply(lambda x: 'Metropol' if x in metropol_nuts3 else 'Other')
+    selection_summary(filtered)
+    return filtered
+
+
+def legacy_export(df, filename):
+    codes = df['neighborhood_code'].dropna().astype(str).drop_duplicates().sort_values()
+    codes.to_csv(filename, index=False, header=False, encoding='utf-8')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='ADNKS_2023.xlsx')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--metropol', help="Metropol province list (CSV, Excel or .txt).")
+    parser.add_argument('--other', help="Other province list (CSV, Excel or .txt).")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--strings', action='store_true', help="Use string columns instead of categoricals.")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    base = load_cached_data(args.data, config)
+    if args.strings:
+        base = base.astype({col: str for col in base.select_dtypes('category').columns})
+    if args.metropol and args.other:
+        metropol_nuts3, other_nuts3 = read_nuts3_codes(args.metropol), read_nuts3_codes(args.other)
+    else:
+        provinces = sorted(base['nuts3'].dropna().unique())
+        metropol_nuts3, other_nuts3 = provinces[::2], provinces[1::2]
+
+    print(f"{'rows':>10}{'step':>10}{'legacy':>12}{'new':>12}{'speedup':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        old_path, new_path = os.path.join(tmp_dir, 'legacy.txt'), os.path.join(tmp_dir, 'new.txt')
+        for scale in args.scales:
+            df = pd.concat([base] * scale, ignore_index=True)
+            t_old, old = best_of(lambda: legacy_filter(df, metropol_nuts3, other_nuts3), args.repeat)
+            t_new, new = best_of(lambda: filter_by_nuts3(df, metropol_nuts3, other_nuts3), args.repeat)
+            assert (old['GroupLabel'].to_numpy() == new['GroupLabel'].astype(str).to_numpy()).all()
+            print(f"{len(df):>10}{'filter':>10}{t_old * 1000:>10.1f}ms{t_new * 1000:>10.1f}ms{t_old / t_new:>9.1f}x")
+
+            t_old, _ = best_of(lambda: legacy_export(old, old_path), args.repeat)
+            t_new, _ = best_of(lambda: export_neighborhood_codes(new, new_path), args.repeat)
+            with open(old_path, 'rb') as f_old, open(new_path, 'rb') as f_new:
+                assert f_old.read() == f_new.read(), "exported lists differ"
+            print(f"{len(df):>10}{'export':>10}{t_old * 1000:>10.1f}ms{t_new * 1000:>10.1f}ms{t_old / t_new:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
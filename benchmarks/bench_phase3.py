@@ -0,0 +1,67 @@
+# benchmarks/bench_phase3.py
+"""Per-stratum mask loop vs one-pass grouped PPS for the Phase 3 metropolitan strata.
+
+Usage: python -m benchmarks.bench_phase3 [--base-size 1000] [--scales 1 10 100] [--repeat 3]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import best_of
+from data_cache import load_cached_data
+from phase3_sampler import draw_metropol_sample
+from sampling_frame import create_population_distribution, compute_sampling_frame
+from stratum_index import build_stratum_index
+from utils import load_config
+
+
+def legacy_metropol_sample(df, sampling_frame):
+    """The original loop: one boolean mask over the full frame and one DataFrame.sample per stratum.
+
+    pandas >= 3 refuses weighted draws where a unit's inclusion probability
+    would exceed one, so large designs raise ValueError here.
+    """
+    results = []
+    for _, row in sampling_frame[sampling_frame['Neighborhood_BŞ'] > 0].iterrows():
+        group_df = df[(df['Group'] == row['Group']) & (df['STATU_CAT'] == 'BŞ')]
+        n = min(int(row['Neighborhood_BŞ']), int((group_df['population'] > 0).sum()))
+        if n:
+            results.append(group_df.sample(n=n, weights=group_df['population'], random_state=42))
+    return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='ADNKS_2023.xlsx')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--base-size', type=int, default=1000)
+    parser.add_argument('--per-neighborhood', type=int, default=10)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    df = load_cached_data(args.data, config)
+    population_distribution = create_population_distribution(df, config)
+    # Built once, as the app and pipeline do, so the grouped column times the draw alone
+    index = build_stratum_index(df)
+    print(f"{len(df)} rows")
+
+    print(f"{'sample size':>12}{'drawn':>8}{'loop':>12}{'grouped':>12}{'speedup':>10}")
+    for scale in args.scales:
+        frame = compute_sampling_frame(population_distribution, args.base_size * scale, args.per_neighborhood)
+        t_grouped, grouped = best_of(lambda: draw_metropol_sample(df, frame, np.random.default_rng(42), index),
+                                     args.repeat)
+        try:
+            t_loop, legacy = best_of(lambda: legacy_metropol_sample(df, frame), args.repeat)
+        except ValueError:
+            print(f"{args.base_size * scale:>12}{len(grouped):>8}{'failed':>12}{t_grouped * 1000:>10.1f}ms{'-':>10}")
+            continue
+        assert grouped.groupby('Group', observed=True).size().equals(legacy.groupby('Group', observed=True).size())
+        print(f"{args.base_size * scale:>12}{len(grouped):>8}{t_loop * 1000:>10.1f}ms"
+              f"{t_grouped * 1000:>10.1f}ms{t_loop / t_grouped:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# benchmarks/bench_suite.py
+"""Time and peak memory of every pipeline stage on synthetic ADNKS data, 50k to 10M rows.
+
+Usage:
+    python -m benchmarks.bench_suite [--rows 50000 500000 5000000] [--repeat 3] [--json results.json]
+        [--baseline previous.json --max-slowdown 1.25]
+
+Exits with status 1 when a stage is slower than `--max-slowdown` times its
+baseline timing for the same row count.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_adnks import generate_adnks
+from data_loader import load_data
+from phase3_sampler import draw_metropol_sample, draw_other_sample
+from pipeline import build_streamed_plan
+from sample_allocator import allocate_sample
+from sampling_frame import create_population_distribution, compute_sampling_frame
+from stratum_index import build_stratum_index
+from utils import load_config
+
+DEFAULT_ROWS = (50_000, 500_000, 5_000_000)
+
+# name -> (function of the shared state, key its result is stored under); later stages use earlier results
+STAGES = {
+    'load_data': (lambda s: load_data(s['csv_path'], s['config'], is_csv=True), 'df'),
+    'create_population_distribution': (lambda s: create_population_distribution(s['df'], s['config']), 'population'),
+    'compute_sampling_frame': (lambda s: compute_sampling_frame(s['population'], s['sample_size'], s['per_neighborhood']),
+                               'frame'),
+    'allocate_sample': (lambda s: allocate_sample(s['population'].copy(), s['sample_size'], s['per_neighborhood']),
+                        None),
+    'build_stratum_index': (lambda s: build_stratum_index(s['df']), 'index'),
+    'metropol_sample': (lambda s: draw_metropol_sample(s['df'], s['frame'], np.random.default_rng(42), s['index']),
+                        None),
+    'other_sample': (lambda s: draw_other_sample(s['df'], s['frame'], np.random.default_rng(42), s['index']), None),
+    # Phase 1 straight from the CSV in chunks: compare its peak with load_data + create_population_distribution
+    'streamed_phase1': (lambda s: build_streamed_plan(s['csv_path'], s['config'], s['sample_size'],
+                                                      s['per_neighborhood'], chunk_rows=s['chunk_rows']), None),
+}
+
+
+def measure(fn, state, repeat):
+    """Best wall time over `repeat` runs, then one traced run for the peak of traced allocations.
+
+    tracemalloc sees Python and NumPy allocations; Arrow buffers behind
+    pandas string columns are not counted.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(state)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak, result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, max_slowdown, min_seconds):
+    """Entries of `results` slower than the matching baseline entry by more than `max_slowdown`."""
+    previous = {(entry['rows'], entry['stage']): entry['seconds'] for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        before = previous.get((entry['rows'], entry['stage']))
+        if before is None or entry['seconds'] < min_seconds:
+            continue
+        if entry['seconds'] > before * max_slowdown:
+            regressions.append({**entry, 'baseline_seconds': before, 'ratio': entry['seconds'] / before})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=list(DEFAULT_ROWS))
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=list(STAGES),
+                        help="Stages to report; the stages they depend on still run.")
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--sample-size', type=int, default=1000)
+    parser.add_argument('--per-neighborhood', type=int, default=10)
+    parser.add_argument('--chunk-rows', type=int, default=250_000, help="Chunk size of the streamed_phase1 stage.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic data.")
+    parser.add_argument('--json', help="Write the results to this file.")
+    parser.add_argument('--baseline', help="Results file of an earlier run to compare against.")
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help="Fail when a stage takes longer than this multiple of its baseline.")
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help="Ignore stages faster than this when checking for regressions (timer noise).")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    results = []
+    print(f"{'rows':>10}  {'stage':<32}{'best':>10}{'peak traced':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in args.rows:
+            csv_path = os.path.join(tmp_dir, f"adnks_{n_rows}.csv")
+            generate_adnks(n_rows, args.seed).to_csv(csv_path, index=False)
+            state = {'config': config, 'csv_path': csv_path,
+                     'sample_size': args.sample_size, 'per_neighborhood': args.per_neighborhood,
+                     'chunk_rows': args.chunk_rows}
+
+            for stage, (fn, key) in STAGES.items():
+                if stage not in args.stages:
+                    if key is not None:
+                        state[key] = fn(state)
+                    continue
+                seconds, peak, result = measure(fn, state, args.repeat)
+                if key is not None:
+                    state[key] = result
+                results.append({'rows': n_rows, 'stage': stage, 'seconds': seconds, 'peak_mb': peak / 2**20})
+                print(f"{n_rows:>10}  {stage:<32}{seconds * 1000:>8.1f}ms{peak / 2**20:>11.1f} MB")
+            os.remove(csv_path)
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_slowdown, args.min_seconds)
+        for entry in regressions:
+            print(f"REGRESSION {entry['stage']} at {entry['rows']} rows: {entry['seconds'] * 1000:.1f}ms vs "
+                  f"{entry['baseline_seconds'] * 1000:.1f}ms ({entry['ratio']:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage slower than {args.max_slowdown:.2f}x baseline ({baseline.get('revision')}).")
+
+
+if __name__ == '__main__':
+    main()
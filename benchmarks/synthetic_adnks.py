@@ -0,0 +1,99 @@
+# benchmarks/synthetic_adnks.py
+"""Synthetic ADNKS-shaped datasets for benchmarking at any size.
+
+Usage: python -m benchmarks.synthetic_adnks --rows 1000000 [--seed 0] --output synthetic_adnks.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# NUTS3 code -> (province, metropolitan municipality, district count, neighborhoods) from ADNKS 2023
+PROVINCES = {
+    'TR100': ('İstanbul', True, 39, 960), 'TR211': ('Tekirdağ', True, 11, 373), 'TR212': ('Edirne', False, 9, 353),
+    'TR213': ('Kırklareli', False, 8, 287), 'TR221': ('Balıkesir', True, 20, 1133),
+    'TR222': ('Çanakkale', False, 12, 658), 'TR310': ('İzmir', True, 30, 1297), 'TR321': ('Aydın', True, 17, 671),
+    'TR322': ('Denizli', True, 19, 616), 'TR323': ('Muğla', True, 13, 574), 'TR331': ('Manisa', True, 17, 1089),
+    'TR332': ('Afyonkarahisar', False, 18, 851), 'TR333': ('Kütahya', False, 13, 770),
+    'TR334': ('Uşak', False, 6, 318), 'TR411': ('Bursa', True, 17, 1060), 'TR412': ('Eskişehir', True, 14, 540),
+    'TR413': ('Bilecik', False, 8, 306), 'TR421': ('Kocaeli', True, 12, 472), 'TR422': ('Sakarya', True, 16, 672),
+    'TR423': ('Düzce', False, 8, 393), 'TR424': ('Bolu', False, 9, 580), 'TR425': ('Yalova', False, 6, 94),
+    'TR510': ('Ankara', True, 25, 1422), 'TR521': ('Konya', True, 31, 1137), 'TR522': ('Karaman', False, 6, 290),
+    'TR611': ('Antalya', True, 19, 913), 'TR612': ('Isparta', False, 13, 421), 'TR613': ('Burdur', False, 11, 322),
+    'TR621': ('Adana', True, 15, 831), 'TR622': ('Mersin', True, 13, 806), 'TR631': ('Hatay', True, 15, 595),
+    'TR632': ('Kahramanmaraş', True, 11, 721), 'TR633': ('Osmaniye', False, 7, 294),
+    'TR711': ('Kırıkkale', False, 9, 270), 'TR712': ('Aksaray', False, 8, 333), 'TR713': ('Niğde', False, 6, 239),
+    'TR714': ('Nevşehir', False, 8, 271), 'TR715': ('Kırşehir', False, 7, 319), 'TR721': ('Kayseri', True, 16, 710),
+    'TR722': ('Sivas', False, 17, 1486), 'TR723': ('Yozgat', False, 14, 792), 'TR811': ('Zonguldak', False, 8, 562),
+    'TR812': ('Karabük', False, 6, 357), 'TR813': ('Bartın', False, 4, 313), 'TR821': ('Kastamonu', False, 20, 1227),
+    'TR822': ('Çankırı', False, 12, 471), 'TR823': ('Sinop', False, 9, 516), 'TR831': ('Samsun', True, 16, 1215),
+    'TR832': ('Tokat', False, 12, 932), 'TR833': ('Çorum', False, 14, 885), 'TR834': ('Amasya', False, 7, 479),
+    'TR901': ('Trabzon', True, 18, 716), 'TR902': ('Ordu', True, 19, 772), 'TR903': ('Giresun', False, 16, 757),
+    'TR904': ('Rize', False, 12, 558), 'TR905': ('Artvin', False, 9, 360), 'TR906': ('Gümüşhane', False, 6, 394),
+    'TRA11': ('Erzurum', True, 20, 1188), 'TRA12': ('Erzincan', False, 9, 681), 'TRA13': ('Bayburt', False, 3, 198),
+    'TRA21': ('Ağrı', False, 8, 664), 'TRA22': ('Kars', False, 8, 437), 'TRA23': ('Iğdır', False, 4, 200),
+    'TRA24': ('Ardahan', False, 6, 266), 'TRB11': ('Malatya', True, 13, 718), 'TRB12': ('Elazığ', False, 11, 703),
+    'TRB13': ('Bingöl', False, 8, 388), 'TRB14': ('Tunceli', False, 8, 409), 'TRB21': ('Van', True, 13, 694),
+    'TRB22': ('Muş', False, 6, 491), 'TRB23': ('Bitlis', False, 7, 476), 'TRB24': ('Hakkari', False, 5, 183),
+    'TRC11': ('Gaziantep', True, 9, 735), 'TRC12': ('Adıyaman', False, 9, 629), 'TRC13': ('Kilis', False, 4, 228),
+    'TRC21': ('Şanlıurfa', True, 13, 1455), 'TRC22': ('Diyarbakır', True, 17, 1056),
+    'TRC31': ('Mardin', True, 10, 701), 'TRC32': ('Batman', False, 6, 427), 'TRC33': ('Şırnak', False, 7, 296),
+    'TRC34': ('Siirt', False, 7, 343),
+}
+# ILCE_STATU 0 = metropolitan district, 1 = provincial centre, 2 = other district
+LOG_POPULATION_MEDIAN = np.log([463, 351, 210])
+LOG_POPULATION_SIGMA = 1.5
+VILLAGE_SHARE = np.array([0.0, 0.65, 0.77])
+
+
+def generate_adnks(n_rows, seed=0):
+    """A raw ADNKS-like frame (original column names) with `n_rows` neighborhoods.
+
+    Rows are spread over the real 81 NUTS3 provinces in proportion to their
+    2023 neighborhood counts, keeping each province's district count.
+    Metropolitan provinces have only status-0 districts; elsewhere the first
+    district is the status-1 'Merkez' and the rest are status 2. Populations
+    are log-normal per status, matched to the real medians.
+    """
+    rng = np.random.default_rng(seed)
+    nuts3 = np.array(list(PROVINCES))
+    province, metropolitan, n_districts, neighborhoods = (np.array(values) for values in zip(*PROVINCES.values()))
+
+    # Largest-remainder split of n_rows over provinces, so the total is exact
+    quota = neighborhoods / neighborhoods.sum() * n_rows
+    counts = np.floor(quota).astype(np.int64)
+    counts[np.argsort(counts - quota)[:n_rows - counts.sum()]] += 1
+    prov = np.repeat(np.arange(len(nuts3)), counts)
+
+    district = np.floor(rng.random(n_rows) * n_districts[prov]).astype(np.int64)
+    status = np.where(metropolitan[prov], 0, np.where(district == 0, 1, 2))
+    district_names = np.array([f'İlçe {k:02d}' for k in range(n_districts.max())])[district]
+    district_names[status == 1] = 'Merkez'
+    population = np.rint(np.exp(rng.normal(LOG_POPULATION_MEDIAN[status], LOG_POPULATION_SIGMA))).astype(np.int64)
+
+    return pd.DataFrame({
+        'MAH_KOY_KODU': np.arange(1, n_rows + 1),
+        'NUTS1KODU': nuts3.astype('<U3')[prov],
+        'NUTS2KODU': nuts3.astype('<U4')[prov],
+        'NUTS3KODU': nuts3[prov],
+        'IL': province[prov],
+        'ILCE': district_names,
+        'ILCE_STATU': status,
+        'STATU': np.where(rng.random(n_rows) < VILLAGE_SHARE[status], 'Köy', 'Mah'),
+        'NUFUS2023': np.maximum(population, 1),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True, help="CSV file to write.")
+    args = parser.parse_args(argv)
+
+    generate_adnks(args.rows, args.seed).to_csv(args.output, index=False)
+    print(f"{args.rows} rows -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# chunked_loader.py
+"""Streaming ingestion of CSV datasets too large to load whole.
+
+The source is read in chunks of `chunk_rows` rows, and only the mapped
+columns (and any other column a special adjustment refers to) are parsed.
+Each chunk is cleaned exactly as load_data cleans a full dataset. It is
+then folded into running totals whose size depends on the number of
+strata, not on the number of rows:
+
+- population per Group x STATU_CAT, the input of Phase 1
+- population matched by each special adjustment
+- rows and population per Group -> STATU_CAT -> status -> nuts3 -> district stratum
+- count, mean and sum of squared deviations of neighborhood population per
+  Group, for Neyman allocation (merged across chunks with Chan's formula)
+
+Memory therefore stays at about one chunk, however long the file is.
+"""
+import numpy as np
+import pandas as pd
+
+from conditions import adjustment_populations, compile_adjustments
+from data_loader import clean_frame, compact_frame, normalize_header
+from instrumentation import instrumented
+from sampling_frame import distribution_table
+from stratum_index import LEVELS
+from utils import SamplingError, get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CHUNK_ROWS = 250_000
+
+
+def iter_clean_chunks(path, config, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Cleaned, compacted chunks of a CSV dataset, reading only the columns in `columns` and those the
+    special adjustment conditions refer to."""
+    wanted = {normalize_header(name) for name in config['columns'].values()}
+    wanted |= {normalize_header(field) for field, _, _ in compile_adjustments(config)['leaves']
+               if field not in config['columns']}
+    warned = set()
+    try:
+        reader = pd.read_csv(path, chunksize=chunk_rows, usecols=lambda name: normalize_header(name) in wanted)
+        for chunk in reader:
+            yield compact_frame(clean_frame(chunk, config, warned), config)
+    except SamplingError:
+        raise
+    except Exception as e:
+        raise SamplingError(f"Error loading dataset: {str(e)}") from e
+
+
+def _add(totals, part):
+    for key, value in part.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+def _merge_moments(moments, part):
+    """Fold per-Group (count, mean, M2) of one chunk into the running moments."""
+    for group, (n_b, mean_b, m2_b) in part.items():
+        if group not in moments:
+            moments[group] = (n_b, mean_b, m2_b)
+            continue
+        n_a, mean_a, m2_a = moments[group]
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        moments[group] = (n, mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n)
+
+
+@instrumented
+def ingest_csv(path, config, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Stream a CSV dataset once and return its Phase 1 summary.
+
+    The result is a dict with 'rows', 'population' ({(Group, STATU_CAT):
+    population}), 'adjustments' ({stratum: population}), 'strata' (a table
+    of rows and population per stratum) and 'moments' ({Group: (count,
+    mean, M2)}).
+    """
+    rows, population, adjustments, strata, moments = 0, {}, {}, {}, {}
+    for i, chunk in enumerate(iter_clean_chunks(path, config, chunk_rows)):
+        rows += len(chunk)
+        values = chunk['population'].astype(np.int64)
+        _add(population, values.groupby([chunk['Group'], chunk['STATU_CAT']], observed=True).sum().to_dict())
+        _add(adjustments, adjustment_populations(chunk, config))
+        stats = values.groupby([chunk[level] for level in LEVELS], observed=True).agg(['size', 'sum'])
+        _add(strata, dict(zip(stats.index, stats.to_numpy())))
+        stats = values.astype(float).groupby(chunk['Group'], observed=True).agg(['size', 'mean', 'var'])
+        stats['m2'] = (stats['var'] * (stats['size'] - 1)).fillna(0)
+        _merge_moments(moments, {group: (n, mean, m2) for group, n, mean, m2
+                                 in stats[['size', 'mean', 'm2']].itertuples(name=None)})
+        logger.info("Chunk %d: %d rows (%d so far)", i + 1, len(chunk), rows)
+
+    if not rows:
+        raise SamplingError("No valid rows in dataset.")
+    strata_table = pd.DataFrame([(*key, int(count), int(total)) for key, (count, total) in strata.items()],
+                                columns=[*LEVELS, 'rows', 'population'])
+    return {
+        'rows': rows,
+        'population': population,
+        'adjustments': adjustments,
+        'strata': strata_table.sort_values(list(LEVELS)).reset_index(drop=True),
+        'moments': moments,
+    }
+
+
+def summary_distribution(summary):
+    """The population distribution of a streamed summary, as create_population_distribution returns it."""
+    table = pd.Series(summary['population']).rename_axis(['Group', 'STATU_CAT']).unstack(fill_value=0)
+    table = table.reset_index()
+    table['Group'] = table['Group'].astype('category')
+    return distribution_table(table, summary['adjustments'])
+
+
+def summary_dispersion(summary, groups):
+    """Standard deviation of neighborhood population per Group (ddof=0), aligned with `groups`."""
+    moments = summary['moments']
+    return np.array([np.sqrt(moments[group][2] / moments[group][0]) if group in moments else 0.0
+                     for group in groups])
@@ -0,0 +1,294 @@
+# conditions.py
+"""Compiler for the `special_adjustments` conditions in config.yaml.
+
+A condition is parsed once into a plan of leaf predicates combined with
+and/or/not, e.g.
+
+    IL == 'Isparta' and ILCE in ('Merkez', 'Eğirdir') and not NUFUS2023 < 100
+
+Supported: ==, !=, <, <=, >, >=, in / not in over a (...) or [...] list,
+and, or, not and parentheses. Values are quoted strings or numbers; field
+names may be the dataset's original headers (mapped through `columns`) or
+internal names such as STATU_CAT; an unknown field is an error. A missing
+value fails every comparison, != and not in included; only a `not (...)`
+around a comparison, which negates its result, matches it.
+"""
+import operator
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from fingerprint import config_digest
+from instrumentation import count, instrumented
+from utils import SamplingError
+
+PLAN_CACHE_SIZE = 16
+DENSE_COMBINATIONS = 1 << 16
+
+_OPERATORS = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<string>'[^']*'|"[^"]*")
+  | (?P<number>-?\d+(?:\.\d+)?(?![\w.]))
+  | (?P<op>==|!=|<=|>=|<|>)
+  | (?P<punct>[(),\[\]])
+  | (?P<word>[^\s()\[\],=!<>'"]+)
+)""", re.VERBOSE)
+_KEYWORDS = {'and', 'or', 'not', 'in'}
+_EXPECTED = {'word': 'a column name', 'value': 'a quoted string or number', 'op': 'a comparison', 'punct': "'(' or '['"}
+
+_plans = OrderedDict()
+
+
+def _tokenize(condition):
+    tokens, pos = [], 0
+    condition = condition.strip()
+    while pos < len(condition):
+        match = _TOKEN.match(condition, pos)
+        if not match or match.end() == pos:
+            raise SamplingError(f"Cannot parse condition '{condition}' at: {condition[pos:]}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'string':
+            tokens.append(('value', text[1:-1]))
+        elif kind == 'number':
+            tokens.append(('value', float(text) if '.' in text else int(text)))
+        elif kind == 'word' and text.lower() in _KEYWORDS:
+            tokens.append(('keyword', text.lower()))
+        else:
+            tokens.append((kind, text))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over the tokens; leaf predicates are interned in `leaves`."""
+
+    def __init__(self, condition, col_map, leaves):
+        self.condition = condition
+        self.tokens = _tokenize(condition)
+        self.pos = 0
+        self.col_map = col_map
+        self.leaves = leaves
+
+    def error(self, expected):
+        found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else 'end of condition'
+        return SamplingError(f"Invalid condition '{self.condition}': expected {expected}, found {found!r}")
+
+    def peek(self, kind, text=None):
+        if self.pos < len(self.tokens):
+            token_kind, token_text = self.tokens[self.pos]
+            return token_kind == kind and (text is None or token_text == text)
+        return False
+
+    def take(self, kind, text=None):
+        if not self.peek(kind, text):
+            raise self.error(repr(text) if text else _EXPECTED[kind])
+        self.pos += 1
+        return self.tokens[self.pos - 1][1]
+
+    def parse(self):
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise self.error("'and', 'or' or end of condition")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek('keyword', 'or'):
+            self.pos += 1
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek('keyword', 'and'):
+            self.pos += 1
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def parse_not(self):
+        if self.peek('keyword', 'not'):
+            self.pos += 1
+            return ('not', self.parse_not())
+        if self.peek('punct', '('):
+            self.pos += 1
+            node = self.parse_or()
+            self.take('punct', ')')
+            return node
+        return self.parse_predicate()
+
+    def parse_predicate(self):
+        field = self.take('word')
+        field = self.col_map.get(field, field)
+        if self.peek('op'):
+            op = self.take('op')
+            value = self.take('value')
+            return self.leaf(field, op, (value,))
+        op = 'in'
+        if self.peek('keyword', 'not'):
+            self.pos += 1
+            op = 'not in'
+        self.take('keyword', 'in')
+        return self.leaf(field, op, self.parse_list())
+
+    def parse_list(self):
+        close = {'(': ')', '[': ']'}
+        if not (self.peek('punct', '(') or self.peek('punct', '[')):
+            raise self.error(_EXPECTED['punct'])
+        opening = self.take('punct')
+        values = [self.take('value')]
+        while self.peek('punct', ','):
+            self.pos += 1
+            if self.peek('punct', close[opening]):
+                break
+            values.append(self.take('value'))
+        self.take('punct', close[opening])
+        return tuple(values)
+
+    def leaf(self, field, op, values):
+        key = (field, op, values)
+        if key not in self.leaves:
+            self.leaves[key] = len(self.leaves)
+        return ('leaf', self.leaves[key])
+
+
+def _compile(conditions, config):
+    col_map = {v: k for k, v in config['columns'].items()}
+    leaves = {}
+    nodes = [_Parser(condition, col_map, leaves).parse() for condition in conditions]
+    return {'leaves': list(leaves), 'nodes': nodes}
+
+
+def _cached_plan(key, build):
+    plan = _plans.get(key)
+    count('condition_plan', hit=plan is not None)
+    if plan is None:
+        plan = _plans[key] = build()
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    else:
+        _plans.move_to_end(key)
+    return plan
+
+
+def compile_adjustments(config):
+    """The mask plan for every special adjustment, parsed once per config (keyed by its digest)."""
+    def build():
+        rules = config.get('special_adjustments') or []
+        plan = _compile([rule['condition'] for rule in rules], config)
+        plan['rules'] = [(rule['stratum'], rule['action']) for rule in rules]
+        return plan
+    return _cached_plan(config_digest(config), build)
+
+
+def compile_condition(condition, config):
+    """Plan for a single condition string, cached like compile_adjustments."""
+    key = config_digest({'columns': config['columns'], 'condition': condition})
+    return _cached_plan(key, lambda: _compile([condition], config))
+
+
+def _leaf_truth(values, op, operands):
+    if op in ('in', 'not in'):
+        truth = np.asarray(pd.Index(values).isin(operands), dtype=bool)
+        if op == 'not in':
+            truth = ~truth
+    else:
+        truth = np.asarray(_OPERATORS[op](values, operands[0]), dtype=bool)
+    return truth & ~np.asarray(pd.isna(values), dtype=bool)
+
+
+def _combinations(plan, df):
+    """Factorize the rows by everything the plan looks at, in one pass over the data.
+
+    Categorical columns contribute their codes (tested later on the
+    categories only); any other column contributes one true/false code per
+    predicate on it. Returns the combination of each row and a leaf truth
+    table over the distinct combinations, which is tiny next to the frame.
+    """
+    by_field = {}
+    for i, (field, op, operands) in enumerate(plan['leaves']):
+        by_field.setdefault(field, []).append((i, op, operands))
+    unknown = [field for field in by_field if field not in df.columns]
+    if unknown:
+        raise SamplingError(f"Unknown column(s) in conditions: {unknown}")
+
+    row_codes, dims, leaf_tables = [], [], []
+    for field, leaves in by_field.items():
+        try:
+            series = df[field]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                categories = series.cat.categories
+                codes = series.cat.codes.to_numpy()
+                if (codes < 0).any():
+                    codes = np.where(codes < 0, len(categories), codes)  # missing values match nothing
+                # One extra all-False row for the missing-value code
+                table = np.zeros((len(categories) + 1, len(leaves)), dtype=bool)
+                for j, (_, op, operands) in enumerate(leaves):
+                    table[:-1, j] = _leaf_truth(categories, op, operands)
+                row_codes.append(codes)
+                dims.append(len(categories) + 1)
+                leaf_tables.append(([i for i, _, _ in leaves], len(row_codes) - 1, table))
+            else:
+                values = series.to_numpy()
+                for i, op, operands in leaves:
+                    row_codes.append(_leaf_truth(values, op, operands).astype(np.intp))
+                    dims.append(2)
+                    leaf_tables.append(([i], len(row_codes) - 1, np.array([[False], [True]])))
+        except Exception as e:
+            raise SamplingError(f"Error evaluating conditions on '{field}': {e}") from e
+
+    if not row_codes:
+        return np.zeros(len(df), dtype=np.intp), np.zeros((1, len(plan['leaves'])), dtype=bool)
+    combined = np.ravel_multi_index(row_codes, dims)
+    if np.prod(dims, dtype=float) <= max(len(df), DENSE_COMBINATIONS):
+        # Small product space: index it directly rather than hashing the rows
+        inverse, keys = combined, np.arange(int(np.prod(dims)))
+    else:
+        inverse, keys = pd.factorize(combined)
+    key_codes = np.unravel_index(keys, dims)
+    masks = np.zeros((len(keys), len(plan['leaves'])), dtype=bool)
+    for leaf_ids, dim, table in leaf_tables:
+        masks[:, leaf_ids] = table[key_codes[dim]]
+    return inverse, masks
+
+
+def _combine(node, masks):
+    kind, arg = node
+    if kind == 'leaf':
+        return masks[:, arg]
+    if kind == 'not':
+        return ~_combine(arg, masks)
+    reduce = np.logical_and.reduce if kind == 'and' else np.logical_or.reduce
+    return reduce([_combine(child, masks) for child in arg])
+
+
+def evaluate_plan(plan, df):
+    """One boolean mask per compiled condition, as arrays aligned with `df`'s rows."""
+    inverse, masks = _combinations(plan, df)
+    return [_combine(node, masks)[inverse] for node in plan['nodes']]
+
+
+@instrumented
+def adjustment_populations(df, config):
+    """Population matched by each `add_population` adjustment, as {stratum: population}.
+
+    The frame is scanned once to total the population per distinct
+    combination of the referenced values; every rule is then evaluated on
+    those few combinations, so adding rules does not add passes over the
+    data. As before, a later rule for the same stratum replaces an earlier one.
+    """
+    plan = compile_adjustments(config)
+    if not plan['rules']:
+        return {}
+    inverse, masks = _combinations(plan, df)
+    combination_population = np.bincount(inverse, weights=df['population'].to_numpy(), minlength=len(masks))
+
+    adjustments = {}
+    for (stratum, action), node in zip(plan['rules'], plan['nodes']):
+        if action == 'add_population':
+            adjustments[stratum] = int(round(combination_population[_combine(node, masks)].sum()))
+    return adjustments
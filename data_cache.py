@@ -0,0 +1,133 @@
+# data_cache.py
+import argparse
+import hashlib
+import io
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from data_loader import load_data
+from fingerprint import config_digest, file_digest, file_stamp
+from instrumentation import count, instrumented
+from utils import atomic_write_bytes, load_config
+
+CACHE_DIR = Path(".cache")
+CACHE_VERSION = 4
+
+
+def cache_key(source_digest, config):
+    return hashlib.sha256(f"{CACHE_VERSION}:{source_digest}:{config_digest(config, 'columns')}".encode()).hexdigest()
+
+
+def _cache_name(path, config):
+    """File stem of a source's cache entries: its name plus a digest of its resolved path and column mapping."""
+    digest = hashlib.sha256(f"{Path(path).resolve()}:{config_digest(config, 'columns')}".encode()).hexdigest()
+    return f"{Path(path).name}-{digest[:12]}"
+
+
+def _manifest_path(path, config, cache_dir):
+    return Path(cache_dir) / f"{_cache_name(path, config)}.json"
+
+
+def _read_manifest(path, config, cache_dir):
+    manifest_path = _manifest_path(path, config, cache_dir)
+    if not manifest_path.exists():
+        return None
+    try:
+        return json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def cache_status(path, config, cache_dir=CACHE_DIR):
+    """Return ('fresh' | 'stale' | 'missing', manifest) without parsing the source.
+
+    The file's size and mtime are checked first; the source bytes are only
+    re-hashed when those changed, so an untouched workbook costs one stat().
+    """
+    manifest = _read_manifest(path, config, cache_dir)
+    if manifest is None or not (Path(cache_dir) / manifest['data_file']).exists():
+        return 'missing', manifest
+    if manifest.get('version') != CACHE_VERSION or manifest.get('mapping') != config_digest(config, 'columns'):
+        return 'stale', manifest
+
+    if file_stamp(path) == (manifest['size'], manifest['mtime_ns']):
+        return 'fresh', manifest
+    if file_digest(path) == manifest['source_digest']:
+        return 'fresh', manifest
+    return 'stale', manifest
+
+
+def build_cache(path, config, is_csv=False, cache_dir=CACHE_DIR):
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    size, mtime_ns = file_stamp(path)
+    source_digest = file_digest(path)
+    key = cache_key(source_digest, config)
+
+    df = load_data(path, config, is_csv=is_csv)
+
+    data_file = f"{_cache_name(path, config)}-{key[:16]}.parquet"
+    buffer = io.BytesIO()
+    df.to_parquet(buffer)
+    atomic_write_bytes(cache_dir / data_file, buffer.getvalue())
+
+    previous = _read_manifest(path, config, cache_dir)
+    manifest = {
+        'version': CACHE_VERSION,
+        'source': str(path),
+        'size': size,
+        'mtime_ns': mtime_ns,
+        'source_digest': source_digest,
+        'mapping': config_digest(config, 'columns'),
+        'key': key,
+        'data_file': data_file,
+        'rows': len(df),
+    }
+    atomic_write_bytes(_manifest_path(path, config, cache_dir), json.dumps(manifest, indent=2).encode())
+
+    if previous and previous.get('data_file') != data_file:
+        (cache_dir / previous['data_file']).unlink(missing_ok=True)
+
+    return df
+
+
+@instrumented
+def load_cached_data(path, config, is_csv=False, cache_dir=CACHE_DIR):
+    """Load the cleaned dataset from the columnar cache, rebuilding it when stale."""
+    status, manifest = cache_status(path, config, cache_dir)
+    count('parquet_cache', hit=status == 'fresh')
+    if status == 'fresh':
+        return pd.read_parquet(Path(cache_dir) / manifest['data_file'])
+    return build_cache(path, config, is_csv=is_csv, cache_dir=cache_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prebuild or check the columnar dataset cache.")
+    parser.add_argument('sources', nargs='+', help="Dataset files (Excel or CSV) to cache.")
+    parser.add_argument('--config', default='config.yaml', help="Path to config.yaml.")
+    parser.add_argument('--cache-dir', default=str(CACHE_DIR), help="Cache directory.")
+    parser.add_argument('--check', action='store_true',
+                        help="Only report cache status; exit 1 if any cache is not fresh.")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    exit_code = 0
+    for source in args.sources:
+        status, _ = cache_status(source, config, args.cache_dir)
+        if args.check:
+            print(f"{source}: {status}")
+            if status != 'fresh':
+                exit_code = 1
+        elif status == 'fresh':
+            print(f"{source}: cache is fresh")
+        else:
+            df = build_cache(source, config, is_csv=source.lower().endswith('.csv'), cache_dir=args.cache_dir)
+            print(f"{source}: cached {len(df)} rows")
+    return exit_code
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,48 +1,100 @@
+import numpy as np
 import pandas as pd
-import streamlit as st
-from utils import load_config, assign_group, classify_statut
+from instrumentation import instrumented
+from utils import SamplingError, get_logger, load_config, assign_groups, classify_statuses
 
-def load_data(file, config, is_csv=False):
-    try:
-        if is_csv:
-            df = pd.read_csv(file, low_memory=False)
-        else:
-            df = pd.read_excel(file, engine='openpyxl')
+logger = get_logger(__name__)
+
+def normalize_header(name):
+    """A source header as normalize_columns sees it: trimmed, spaces as underscores, upper case."""
+    return str(name).strip().replace('\u00a0', ' ').replace(' ', '_').upper()
+
+def normalize_columns(df, config):
+    df.columns = df.columns.map(normalize_header)
+    column_mapping = {v: k for k, v in config['columns'].items()}
+    return df.rename(columns=column_mapping)
+
+def _narrow_int(series, dtype):
+    """`series` as `dtype` when every value is a whole number in its range, else unchanged."""
+    values = series.to_numpy()
+    info = np.iinfo(dtype)
+    if len(values) and not (np.array_equal(values, np.round(values)) and info.min <= values.min() <= values.max() <= info.max):
+        return series
+    return series.astype(dtype)
 
-        st.write("Original dataset columns:", df.columns.tolist())
+def compact_frame(df, config):
+    """The cleaned frame with categorical labels and narrow integers.
 
-        df.columns = df.columns.str.strip().str.replace('\u00a0', ' ').str.replace(' ', '_').str.upper()
+    Labels repeat across tens of thousands of rows, so categories store each
+    string once; status fits in int8 and population/neighborhood codes in
+    int32 (wider types are kept if the data does not fit). Source columns
+    outside the mapping (neighborhood names, district codes, ...) are kept
+    for the outputs and for special adjustment conditions.
+    """
+    df = df.reset_index(drop=True)
+    compact = {}
+    for col in df.columns:
+        series = df[col]
+        if col == 'status':
+            compact[col] = _narrow_int(series, np.int8)
+        elif col in ('population', 'neighborhood_code') and pd.api.types.is_numeric_dtype(series):
+            compact[col] = _narrow_int(series, np.int32)
+        elif col in config['columns'] or col in ('STATU_CAT', 'Group') or not pd.api.types.is_numeric_dtype(series):
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                compact[col] = series.astype('category')
+    return df.assign(**compact)
 
-        column_mapping = {v: k for k, v in config['columns'].items()}
-        df = df.rename(columns=column_mapping)
+def clean_frame(df, config, warned=None):
+    """Normalize columns, drop incomplete and out-of-scope rows, and add STATU_CAT and Group.
 
-        required_columns = list(config['columns'].keys())
-        missing_cols = [col for col in required_columns if col not in df.columns]
-        if missing_cols:
-            st.error(f"Missing columns in dataset: {missing_cols}")
-            st.stop()
+    Works on a whole dataset or on one chunk of it; pass the same `warned`
+    set for every chunk to log each missing-NUTS warning once.
+    """
+    df = normalize_columns(df, config)
 
-        nuts_cols = ['nuts1', 'nuts2', 'nuts3']
-        for col in nuts_cols:
-            if df[col].isna().any():
-                st.warning(f"Missing values found in {col}. Dropping affected rows.")
-                df = df.dropna(subset=[col])
+    required_columns = list(config['columns'].keys())
+    missing_cols = [col for col in required_columns if col not in df.columns]
+    if missing_cols:
+        raise SamplingError(f"Missing columns in dataset: {missing_cols}")
 
-        df = df.dropna(subset=required_columns)
+    warned = set() if warned is None else warned
+    nuts_cols = ['nuts1', 'nuts2', 'nuts3']
+    for col in nuts_cols:
+        if df[col].isna().any():
+            if col not in warned:
+                logger.warning("Missing values found in %s. Dropping affected rows.", col)
+                warned.add(col)
+            df = df.dropna(subset=[col])
 
-        df['STATU_CAT'] = df['status'].apply(classify_statut)
-        df = df[df['STATU_CAT'].isin(['BŞ', 'M&D'])]
+    df = df.dropna(subset=required_columns)
 
-        df['Group'] = df.apply(assign_group, axis=1)
+    df['STATU_CAT'] = classify_statuses(df['status'])
+    df = df[df['STATU_CAT'].isin(['BŞ', 'M&D'])].copy()
+    df['STATU_CAT'] = df['STATU_CAT'].cat.remove_unused_categories()
+
+    df['Group'] = assign_groups(df)
+
+    if df['Group'].isna().any():
+        raise SamplingError("Some rows have missing Group assignments. Check NUTS codes. "
+                            f"Rows with missing groups:\n{df[df['Group'].isna()][nuts_cols].head()}")
+    return df
+
+@instrumented
+def load_data(file, config, is_csv=False):
+    try:
+        if is_csv:
+            df = pd.read_csv(file, low_memory=False)
+        else:
+            df = pd.read_excel(file, engine='openpyxl')
 
-        if df['Group'].isna().any():
-            st.error("Some rows have missing Group assignments. Check NUTS codes.")
-            st.write("Rows with missing groups:", df[df['Group'].isna()][nuts_cols].head())
-            st.stop()
+        logger.info("Original dataset columns: %s", df.columns.tolist())
 
-        st.success(f"Dataset loaded successfully with {len(df)} rows.")
+        df = compact_frame(clean_frame(df, config), config)
+        logger.info("Dataset loaded successfully with %d rows (%.1f MB).", len(df),
+                    df.memory_usage(deep=True).sum() / 2**20)
         return df
 
+    except SamplingError:
+        raise
     except Exception as e:
-        st.error(f"Error loading dataset: {str(e)}")
-        st.stop()
+        raise SamplingError(f"Error loading dataset: {str(e)}") from e
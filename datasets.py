@@ -0,0 +1,141 @@
+# datasets.py
+"""Several ADNKS releases under one design: parallel loading and side-by-side plans.
+
+Datasets are listed under `datasets:` in config.yaml; each entry may
+override the column mapping (e.g. `population: NUFUS2024`). Without that
+section the single default dataset is used.
+
+Usage:
+    python datasets.py --sample-size 1000 --per-neighborhood 10 [--workers 4] [--output comparison.csv]
+"""
+import argparse
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from fingerprint import config_digest, file_stamp
+from pipeline import DEFAULT_DATA_PATH, build_plan, load_dataset
+from utils import LOGGER_NAME, SamplingError, get_logger, load_config
+
+logger = get_logger(__name__)
+
+COMPARISON_MEASURES = ('BŞ', 'M&D', 'Total_Pop', 'Sample_Size', 'Neighborhood_Count', 'Neighborhood_BŞ',
+                       'Neighborhood_M&D')
+
+
+def dataset_config(config, dataset):
+    """The config as seen by one dataset: its column overrides merged into `columns`."""
+    return {**config, 'columns': {**config['columns'], **(dataset.get('columns') or {})}}
+
+
+def dataset_entries(config):
+    """Registered datasets as [{'name', 'path', 'config'}], in config order."""
+    datasets = config.get('datasets') or [{'name': Path(DEFAULT_DATA_PATH).stem, 'path': DEFAULT_DATA_PATH}]
+    entries, names = [], set()
+    for dataset in datasets:
+        if 'path' not in dataset:
+            raise SamplingError(f"Dataset entry without a path: {dataset}")
+        name = str(dataset.get('name') or Path(dataset['path']).stem)
+        if name in names:
+            raise SamplingError(f"Dataset name '{name}' is registered twice.")
+        names.add(name)
+        entries.append({'name': name, 'path': dataset['path'], 'config': dataset_config(config, dataset)})
+    return entries
+
+
+def dataset_key(entry):
+    """Identity of a dataset's loaded frame: its file on disk plus its column mapping."""
+    try:
+        stamp = file_stamp(entry['path'])
+    except OSError as e:
+        raise SamplingError(f"{entry['name']}: cannot read {entry['path']}: {e}") from e
+    return entry['path'], stamp, config_digest(entry['config'], 'columns')
+
+
+def load_datasets(entries, load=None, workers=None):
+    """Load every dataset concurrently; returns {name: frame} in entry order.
+
+    `load(entry)` defaults to the Parquet-cached loader, so each dataset
+    has its own cache and an unchanged release loads from Parquet. Threads
+    suffice because reading Excel/Parquet and hashing spend much of their
+    time outside the GIL.
+    """
+    load = load or (lambda entry: load_dataset(entry['config'], entry['path']))
+    if not entries:
+        return {}
+
+    def run(entry):
+        try:
+            return load(entry)
+        except SamplingError as e:
+            raise SamplingError(f"{entry['name']}: {e}") from e
+        except OSError as e:
+            raise SamplingError(f"{entry['name']}: cannot read {entry['path']}: {e}") from e
+
+    with ThreadPoolExecutor(max_workers=workers or min(len(entries), 8)) as pool:
+        # Each load runs in a copy of the caller's context, so an active instrumentation recorder sees it
+        futures = [pool.submit(contextvars.copy_context().run, run, entry) for entry in entries]
+        frames = [future.result() for future in futures]
+    return {entry['name']: df for entry, df in zip(entries, frames)}
+
+
+def plan_datasets(frames, entries, total_sample_size, interviews_per_neighborhood):
+    """{name: (population_distribution, sampling_frame)} for every loaded dataset."""
+    return {entry['name']: build_plan(frames[entry['name']], entry['config'], total_sample_size,
+                                      interviews_per_neighborhood)
+            for entry in entries if entry['name'] in frames}
+
+
+def compare_plans(plans, measures=COMPARISON_MEASURES):
+    """One row per Group with each measure side by side per dataset, e.g. 'Total_Pop (ADNKS 2023)'."""
+    columns = {}
+    for name, (_, frame) in plans.items():
+        table = frame.set_index(frame['Group'].astype(str))
+        for measure in measures:
+            if measure in table.columns:
+                columns[(measure, name)] = table[measure]
+    if not columns:
+        return pd.DataFrame(columns=['Group'])
+    wide = pd.DataFrame(columns).fillna(0)
+    wide = wide[[key for measure in measures for key in columns if key[0] == measure]]
+    wide.columns = [f"{measure} ({name})" for measure, name in wide.columns]
+    return wide.rename_axis('Group').sort_index().reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Side-by-side Phase 1 plans for every registered dataset.")
+    parser.add_argument('--config', default='config.yaml', help="Path to config.yaml.")
+    parser.add_argument('--sample-size', type=int, required=True, help="Total number of interviews.")
+    parser.add_argument('--per-neighborhood', type=int, required=True, help="Interviews per neighborhood.")
+    parser.add_argument('--workers', type=int, default=None, help="Datasets loaded at once.")
+    parser.add_argument('--output', help="Write the comparison table to this CSV file.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log progress messages, not just warnings.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(levelname)s %(name)s: %(message)s')
+    logging.getLogger(LOGGER_NAME).setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    try:
+        entries = dataset_entries(load_config(args.config))
+        start = time.perf_counter()
+        frames = load_datasets(entries, workers=args.workers)
+        logger.info("Loaded %d datasets in %.1fs", len(frames), time.perf_counter() - start)
+        comparison = compare_plans(plan_datasets(frames, entries, args.sample_size, args.per_neighborhood))
+    except SamplingError as e:
+        logger.error("%s", e)
+        return 1
+
+    if args.output:
+        comparison.to_csv(args.output, index=False, encoding='utf-8')
+        print(f"Comparison written to {args.output}")
+    else:
+        print(comparison.to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
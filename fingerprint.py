@@ -0,0 +1,43 @@
+# fingerprint.py
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's raw bytes."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def bytes_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_stamp(path):
+    """Cheap identity of a file on disk: (size, mtime_ns)."""
+    stat = Path(path).stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def config_digest(config, section=None):
+    """SHA-256 of the config (or one section of it), independent of key order."""
+    payload = config if section is None else config.get(section)
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def frame_digest(df):
+    """SHA-256 over pandas' per-row hashes, including the index and column names."""
+    sha = hashlib.sha256()
+    sha.update(json.dumps([str(c) for c in df.columns]).encode())
+    sha.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+def combine_digests(*digests):
+    return hashlib.sha256(':'.join(digests).encode()).hexdigest()
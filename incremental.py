@@ -0,0 +1,120 @@
+# incremental.py
+"""Incremental Phase 3: redraw only the strata whose plan or rows changed since the last run.
+
+Draws here use permanent random numbers (PRNs) instead of a random
+stream. Each neighborhood's PRN comes from the seed and its
+neighborhood_code, qualified by province, district and neighborhood status
+because codes repeat across provinces. Each district's PRN comes from its
+Group/STATU_CAT/status/nuts3/district key. A stratum's sample then depends only
+on its rows, its planned size and the seed, so:
+
+- a stratum that did not change gets exactly the sample it had, and is
+  reused from the previous run's state instead of being drawn again;
+- a stratum whose size grows keeps its neighborhoods and adds the next
+  ones by key order, and one that shrinks drops the last ones (within each
+  chosen district for M&D strata), which keeps field assignments stable.
+  The Pareto keys also depend on the target probabilities, which move a
+  little with the size, so on rare occasions a neighborhood is swapped.
+
+A stratum is a Group x STATU_CAT. Its signature is its planned
+neighborhoods (and districts per cell, for M&D), its row count, its
+population and a checksum of its neighborhood codes.
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+from phase3_sampler import draw_metropol_positions, draw_other_positions, with_design_weights
+from pps_sampler import permanent_random_numbers
+from stratum_index import build_stratum_index, stratum_population, union_rows
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+STATU_CATS = ('BŞ', 'M&D')
+NEIGHBORHOOD_KEY = ('nuts3', 'district', 'neighborhood_status', 'neighborhood_code')
+
+
+def neighborhood_prn(df, rows, seed):
+    """A permanent random number per row position in `rows`, from the NEIGHBORHOOD_KEY columns."""
+    keys = pd.util.hash_pandas_object(df.iloc[rows][list(NEIGHBORHOOD_KEY)], index=False).to_numpy()
+    return permanent_random_numbers(keys, seed)
+
+
+def district_prn(index, seed):
+    """A permanent random number per district of the index (aligned with index['leaf_codes'])."""
+    keys = pd.DataFrame({level: np.asarray(index['uniques'][i].take(index['leaf_codes'][:, i]), dtype=object)
+                         for i, level in enumerate(index['levels'])})
+    return permanent_random_numbers(pd.util.hash_pandas_object(keys, index=False).to_numpy(), seed)
+
+
+def stratum_signatures(df, index, sampling_frame, districts_per_cell=1):
+    """{(Group, STATU_CAT): signature} for every stratum of the plan; equal signatures give equal draws."""
+    codes = df['neighborhood_code'].to_numpy(dtype=np.int64)
+    signatures = {}
+    for group, n_metropol, n_other in sampling_frame[['Group', 'Neighborhood_BŞ', 'Neighborhood_M&D']].itertuples(
+            index=False):
+        for statu_cat, size, per_cell in (('BŞ', n_metropol, None), ('M&D', n_other, districts_per_cell)):
+            start, stop = index['slices'].get((group, statu_cat), (0, 0))
+            signatures[(group, statu_cat)] = (int(size), per_cell, stop - start,
+                                              int(stratum_population(index, group, statu_cat)),
+                                              int(codes[index['order'][start:stop]].sum()))
+    return signatures
+
+
+def _by_group(sample, groups):
+    """Split a drawn sample into one frame per Group, keeping empty frames for Groups that drew nothing."""
+    labels = sample['Group'].to_numpy() if len(sample) else np.empty(0, dtype=object)
+    return {group: sample[labels == group].reset_index(drop=True) for group in groups}
+
+
+@instrumented
+def draw_incremental(df, sampling_frame, index=None, seed=42, districts_per_cell=1, previous=None, progress=None):
+    """Metropol and Other samples drawn with PRNs, reusing every stratum of `previous` whose signature is unchanged.
+
+    `previous` is the state returned by an earlier call (or None). Returns
+    (metropol_sample, other_sample, shortfalls, state, redrawn), where
+    `redrawn` lists the (Group, STATU_CAT) strata drawn this time.
+    """
+    if index is None:
+        index = build_stratum_index(df)
+    report = progress or (lambda done, total, label: None)
+    kept = previous['strata'] if previous is not None and previous['seed'] == seed else {}
+    signatures = stratum_signatures(df, index, sampling_frame, districts_per_cell)
+    redrawn = [key for key, signature in signatures.items() if key not in kept or kept[key][0] != signature]
+    logger.info("Incremental sampling: %d of %d strata changed", len(redrawn), len(signatures))
+
+    # Only the rows of changed strata need their permanent random numbers
+    weights = df['population'].to_numpy()
+    prn = np.zeros(len(df))
+    rows = union_rows(index, redrawn)
+    prn[rows] = neighborhood_prn(df, rows, seed)
+
+    strata = {}
+    for step, statu_cat in enumerate(STATU_CATS):
+        report(step, len(STATU_CATS), f"{statu_cat} strata")
+        groups = [group for group, cat in redrawn if cat == statu_cat]
+        if not groups:
+            continue
+        frame = sampling_frame[sampling_frame['Group'].isin(groups)]
+        shortfalls = []
+        if statu_cat == 'BŞ':
+            positions, stages = draw_metropol_positions(index, frame, weights, None, probabilities=True, prn=prn)
+        else:
+            positions, shortfalls, stages = draw_other_positions(index, frame, weights, None,
+                                                                 districts_per_cell=districts_per_cell,
+                                                                 probabilities=True, prn=prn,
+                                                                 district_prn=district_prn(index, seed))
+        samples = _by_group(with_design_weights(df.iloc[positions].reset_index(drop=True), stages), groups)
+        for group in groups:
+            strata[(group, statu_cat)] = (signatures[(group, statu_cat)], samples[group],
+                                          [shortfall for shortfall in shortfalls if shortfall[0] == group])
+
+    for key in signatures:
+        strata.setdefault(key, kept.get(key))
+    state = {'seed': seed, 'strata': {key: strata[key] for key in signatures}}
+    metropol_sample, other_sample = (pd.concat([state['strata'][(group, statu_cat)][1]
+                                                for group in sampling_frame['Group']], ignore_index=True)
+                                     for statu_cat in STATU_CATS)
+    shortfalls = [shortfall for _, _, stratum_shortfalls in state['strata'].values() for shortfall in stratum_shortfalls]
+    return metropol_sample, other_sample, shortfalls, state, redrawn
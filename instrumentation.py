@@ -0,0 +1,244 @@
+# instrumentation.py
+"""Opt-in timers, row counts, memory deltas and cache counters for the pipeline.
+
+Instrumented functions cost one context-variable lookup until a Recorder
+is activated for the current thread (or task):
+
+    recorder = Recorder(memory=True, profile='cprofile')
+    with recorder:
+        run_pipeline(...)
+    recorder.write_json('metrics.json')
+    recorder.write_trace('trace.json')      # chrome://tracing / Perfetto
+    recorder.write_profile('run.prof')
+
+Spans nest; a span's time and memory include those of the spans it calls.
+Memory deltas come from tracemalloc (Python and NumPy allocations) and are
+only recorded with memory=True, which slows the run down noticeably.
+"""
+import contextvars
+import functools
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from utils import SamplingError, atomic_write_bytes
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+_recorder = contextvars.ContextVar('sampling_recorder', default=None)
+
+
+def current_recorder():
+    return _recorder.get()
+
+
+def activate(recorder):
+    """Make `recorder` (or None, to switch recording off) current for this thread's later calls."""
+    _recorder.set(recorder)
+
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(value)
+    if isinstance(value, tuple) and value:
+        return _rows(value[0])
+    return None
+
+
+class Recorder:
+    """Collects spans and cache counters for one run."""
+
+    def __init__(self, memory=False, profile=None):
+        if profile is not None and profile not in PROFILERS:
+            raise SamplingError(f"Unknown profiler: {profile}. Expected one of {', '.join(PROFILERS)}.")
+        self.memory = memory
+        self.profile = profile
+        self.spans = []
+        self.counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self.origin = time.perf_counter()
+        self.seconds = None
+        self._profiler = None
+        self._owns_tracing = False
+        self._token = None
+
+    def start(self):
+        self.origin = time.perf_counter()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        if self.profile == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError as e:
+                raise SamplingError("The pyinstrument profiler is not installed (pip install pyinstrument).") from e
+            self._profiler = Profiler()
+            self._profiler.start()
+        return self
+
+    def stop(self):
+        if self._profiler is not None:
+            if self.profile == 'cprofile':
+                self._profiler.disable()
+            elif self._profiler.is_running:
+                self._profiler.stop()
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+        self.seconds = time.perf_counter() - self.origin
+
+    def __enter__(self):
+        self._token = _recorder.set(self.start())
+        return self
+
+    def __exit__(self, *exc):
+        _recorder.reset(self._token)
+        self.stop()
+
+    def count(self, name, hit):
+        self.counters[name]['hits' if hit else 'misses'] += 1
+
+    def summary(self):
+        """Per-span totals (calls, seconds, rows, memory) and cache counters, ready for JSON."""
+        totals = {}
+        for span in self.spans:
+            total = totals.setdefault(span['name'], {'name': span['name'], 'calls': 0, 'seconds': 0.0,
+                                                     'max_seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                                     'memory_delta_mb': 0.0 if self.memory else None})
+            total['calls'] += 1
+            total['seconds'] += span['seconds']
+            total['max_seconds'] = max(total['max_seconds'], span['seconds'])
+            total['rows_in'] += span.get('rows_in') or 0
+            total['rows_out'] += span.get('rows_out') or 0
+            if self.memory:
+                total['memory_delta_mb'] += span.get('memory_delta', 0) / 2**20
+        return {
+            'wall_seconds': self.seconds if self.seconds is not None else time.perf_counter() - self.origin,
+            'spans': sorted(totals.values(), key=lambda total: -total['seconds']),
+            'counters': {name: dict(counts) for name, counts in sorted(self.counters.items())},
+        }
+
+    def summary_frame(self):
+        """The span totals as a table, times in milliseconds."""
+        table = pd.DataFrame(self.summary()['spans'],
+                             columns=['name', 'calls', 'seconds', 'max_seconds', 'rows_in', 'rows_out',
+                                      'memory_delta_mb'])
+        table.insert(2, 'ms', (table.pop('seconds') * 1000).round(1))
+        table.insert(3, 'max_ms', (table.pop('max_seconds') * 1000).round(1))
+        table['memory_delta_mb'] = table['memory_delta_mb'].astype(float).round(2)
+        return table
+
+    def counters_frame(self):
+        return pd.DataFrame([{'cache': name, **counts} for name, counts in sorted(self.counters.items())],
+                            columns=['cache', 'hits', 'misses'])
+
+    def trace_events(self):
+        """The spans in Chrome trace-event format, with the cache counters as counter events."""
+        pid = os.getpid()
+        events = [{'name': span['name'], 'cat': 'sampling', 'ph': 'X', 'pid': pid, 'tid': span['thread'],
+                   'ts': span['start'] * 1e6, 'dur': span['seconds'] * 1e6,
+                   'args': {key: span[key] for key in ('rows_in', 'rows_out', 'memory_delta') if key in span}}
+                  for span in self.spans]
+        end = max((span['start'] + span['seconds'] for span in self.spans), default=0.0)
+        events += [{'name': name, 'cat': 'cache', 'ph': 'C', 'pid': pid, 'tid': 0, 'ts': end * 1e6,
+                    'args': dict(counts)} for name, counts in sorted(self.counters.items())]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_json(self, path):
+        atomic_write_bytes(path, json.dumps(self.summary(), indent=2).encode())
+
+    def write_trace(self, path):
+        atomic_write_bytes(path, json.dumps(self.trace_events()).encode())
+
+    def profile_text(self, limit=30):
+        """The profiler's report as text: top functions by cumulative time, or pyinstrument's call tree."""
+        if self._profiler is None:
+            return ''
+        if self.profile == 'cprofile':
+            import pstats
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats('cumulative').print_stats(limit)
+            return stream.getvalue()
+        return self._profiler.output_text()
+
+    def write_profile(self, path):
+        """cProfile stats (open with pstats or snakeviz), or pyinstrument's HTML report."""
+        if self._profiler is None:
+            raise SamplingError("This run was not profiled.")
+        if self.profile == 'cprofile':
+            self._profiler.dump_stats(path)
+        else:
+            atomic_write_bytes(path, self._profiler.output_html().encode())
+
+
+@contextmanager
+def span(name, rows_in=None):
+    """Time the enclosed block as `name`; set `rows_out` on the yielded dict to record it."""
+    recorder = _recorder.get()
+    if recorder is None:
+        yield {}
+        return
+    record = {'name': name, 'thread': threading.get_ident()}
+    if rows_in is not None:
+        record['rows_in'] = rows_in
+    memory_before = tracemalloc.get_traced_memory()[0] if recorder.memory and tracemalloc.is_tracing() else None
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['start'] = start - recorder.origin
+        if memory_before is not None and tracemalloc.is_tracing():
+            record['memory_delta'] = tracemalloc.get_traced_memory()[0] - memory_before
+        recorder.spans.append(record)
+
+
+def instrumented(fn=None, *, name=None):
+    """Decorator recording a span per call, with the rows of its first DataFrame argument and of its result."""
+    if fn is None:
+        return functools.partial(instrumented, name=name)
+    span_name = name or fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _recorder.get() is None:
+            return fn(*args, **kwargs)
+        rows_in = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+        with span(span_name, rows_in) as record:
+            result = fn(*args, **kwargs)
+            rows_out = _rows(result)
+            if rows_out is not None:
+                record['rows_out'] = rows_out
+            return result
+    return wrapper
+
+
+def count(name, hit):
+    """Count a cache hit or miss under `name` on the current recorder, if any."""
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.count(name, hit)
+
+
+@contextmanager
+def cache_lookup(name):
+    """Count a lookup as a hit unless the cached function's body calls count(name, hit=False) inside it.
+
+    For caches such as st.cache_resource that do not report whether they ran the function.
+    """
+    recorder = _recorder.get()
+    misses = recorder.counters[name]['misses'] if recorder is not None else 0
+    yield
+    if recorder is not None and recorder.counters[name]['misses'] == misses:
+        recorder.count(name, hit=True)
@@ -0,0 +1,117 @@
+# jobs.py
+"""Background jobs with progress, cancellation, in-flight deduplication and a shared result store.
+
+A JobStore runs functions on a small thread pool. Each job is keyed by
+its exact inputs, so submitting a key that is already running returns
+the running job, and a key that has already finished returns the stored
+result straight away. Finished results are kept in a bounded LRU.
+
+The job function receives a `progress(done, total, label)` callback as
+its first argument. Calling it after cancel() raises JobCancelled, so
+cancellation takes effect at the next progress report. A job is shared by
+everyone who submitted its key, so cancelling it cancels it for all of them.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import SamplingError, get_logger
+
+logger = get_logger(__name__)
+
+JOB_WORKERS = 2
+JOB_RESULTS = 32
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """One submitted run: its status, latest progress and, once finished, result or error."""
+
+    def __init__(self, key):
+        self.key = key
+        self.status = 'queued'
+        self.done = 0
+        self.total = 0
+        self.label = ''
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def cancel(self):
+        self._cancel.set()
+
+    def progress(self, done, total, label=''):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.done, self.total, self.label = done, total, label
+
+
+class JobStore:
+    """Thread pool plus the jobs in flight and an LRU of finished ones, shared by every caller."""
+
+    def __init__(self, workers=JOB_WORKERS, max_results=JOB_RESULTS):
+        self.max_results = max_results
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sampling-job')
+        self._lock = threading.RLock()
+        self._running = {}
+        self._finished = OrderedDict()
+
+    def submit(self, key, fn, *args, valid=None, **kwargs):
+        """The job for `key`: a finished or in-flight one if there is one, else a new run of fn(progress, ...).
+
+        A finished result for which `valid(result)` is false is dropped and run again.
+        """
+        with self._lock:
+            job = self.get(key)
+            if job is not None and job.status == 'done' and valid is not None and not valid(job.result):
+                self._finished.pop(key, None)
+                job = None
+            if job is not None:
+                return job
+            job = self._running[key] = Job(key)
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            if key in self._finished:
+                self._finished.move_to_end(key)
+                return self._finished[key]
+            return self._running.get(key)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = 'running'
+        try:
+            job.progress(0, 0, 'starting')
+            job.result = fn(job.progress, *args, **kwargs)
+            job.status = 'done'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except SamplingError as e:
+            job.error, job.status = str(e), 'failed'
+        except Exception as e:
+            logger.exception("Background job %s failed", job.key)
+            job.error, job.status = f"Unexpected error: {e}", 'failed'
+        job.finished = time.time()
+
+        with self._lock:
+            self._running.pop(job.key, None)
+            # Only successful results are shared; a cancelled or failed key can simply be submitted again
+            if job.status == 'done':
+                self._finished[job.key] = job
+                while len(self._finished) > self.max_results:
+                    self._finished.popitem(last=False)
@@ -1,17 +1,25 @@
 # main.py
-import streamlit as st
-import pandas as pd
+import json
+import logging
 import pickle
-import hashlib
 from pathlib import Path
 
-from data_loader import load_data
-from sampling_frame import create_population_distribution, compute_sampling_frame
-from sample_allocator import allocate_sample
-from output_generator import generate_outputs
-from utils import load_config
-from phase2_neighborhood_selection import neighborhood_selection_ui
-from phase3_sampler import sample_metropol_neighborhoods, sample_other_neighborhoods
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from allocation import ALLOCATION_METHODS
+from datasets import compare_plans, dataset_entries, dataset_key, load_datasets
+from fingerprint import bytes_digest, combine_digests, config_digest, frame_digest
+from jobs import JobStore
+from instrumentation import PROFILERS, Recorder, activate, cache_lookup, count, span
+from output_generator import OUTPUT_FORMATS, cached_archive
+from pipeline import build_plan, load_dataset, run_final_sampling, select_neighborhood_rows
+from sampling_frame import create_population_distribution, compute_sampling_frame, population_dispersion
+from stage_cache import StageCache
+from stratum_index import build_stratum_index
+from sweep import SWEEP_MEASURES, sweep_frames, sweep_summary
+from utils import LOGGER_NAME, SamplingError, load_config, atomic_write_bytes, memory_footprint
 
 st.set_page_config(page_title="Stratified Sampling Tool", layout="wide")
 st.title("📊 Stratified Sampling Framework")
@@ -45,56 +53,239 @@ This app consists of **four structured phases**:
 All data is cached unless reset. You can rerun each section independently.
 """)
 
-# Load configuration
-config = load_config()
+# Show engine warnings and errors in the page; the handler is attached once per process
+class StreamlitLogHandler(logging.Handler):
+    def emit(self, record):
+        # Background jobs have no page to write to; their problems come back in the job's result or error
+        if get_script_run_ctx() is None:
+            return
+        message = self.format(record)
+        if record.levelno >= logging.ERROR:
+            st.error(message)
+        else:
+            st.warning(message)
+
+engine_logger = logging.getLogger(LOGGER_NAME)
+if not any(handler.get_name() == 'streamlit' for handler in engine_logger.handlers):
+    streamlit_handler = StreamlitLogHandler(level=logging.WARNING)
+    streamlit_handler.set_name('streamlit')
+    engine_logger.addHandler(streamlit_handler)
+
+def run_or_stop(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except SamplingError as e:
+        st.error(str(e))
+        st.stop()
+
+# Opt-in diagnostics (panel at the bottom): record this rerun's timings, rows, memory and cache hits.
+# A recorder left running by a rerun that stopped early is closed first so its profiler and tracemalloc end.
+previous_recorder = st.session_state.pop('diagnostics_recorder', None)
+if previous_recorder is not None and previous_recorder.seconds is None:
+    previous_recorder.stop()
+recorder = None
+if st.session_state.get('diagnostics'):
+    profiler = st.session_state.get('diagnostics_profiler', 'none')
+    recorder = run_or_stop(Recorder, memory=st.session_state.get('diagnostics_memory', False),
+                           profile=None if profiler == 'none' else profiler)
+    st.session_state['diagnostics_recorder'] = run_or_stop(recorder.start)
+activate(recorder)
+
+# Load configuration and pick the dataset the phases run on
+config = run_or_stop(load_config)
+entries = run_or_stop(dataset_entries, config)
+dataset_names = [entry['name'] for entry in entries]
+if len(entries) > 1:
+    dataset_name = st.selectbox("Dataset", dataset_names, key="dataset")
+else:
+    dataset_name = dataset_names[0]
+entry = entries[dataset_names.index(dataset_name)]
+data_config = entry['config']
 
 # Constants
-DEFAULT_DATA_PATH = "ADNKS_2023.xlsx"
 CACHE_PATH = Path("population_distribution.pkl")
 HASH_PATH = Path("data_hash.txt")
 
-# Compute file hash
-def compute_hash(df, config):
-    return hashlib.sha256((df.to_csv(index=False) + str(config)).encode()).hexdigest()
+# Output archives live in a directory pruned across sessions; a remembered path is only valid while its file exists
+def archive_exists(path):
+    return Path(path).exists()
+
+# Fingerprint of the loaded data and config; the frame digest is computed once per load
+def compute_hash(data_digest, config):
+    return combine_digests(data_digest, config_digest(config))
+
+# Load a dataset and its stratum index; keyed on the file's (size, mtime) so edits on disk invalidate the memo.
+# cache_resource hands every session the same objects instead of a per-session unpickled copy; they are
+# treated as read-only (pandas copy-on-write keeps derived frames from writing back into them).
+@st.cache_resource
+def shared_dataset(key, data_config):
+    count('shared_dataset', hit=False)
+    path = key[0]
+    df = load_dataset(data_config, path)
+    return df, frame_digest(df), build_stratum_index(df)
+
+# st.cache_resource does not say whether it ran the function; a miss is counted from inside it
+def load_shared_dataset(key, data_config):
+    with cache_lookup('shared_dataset'):
+        return shared_dataset(key, data_config)
+
+def read_population_cache(current_hash):
+    if not (HASH_PATH.exists() and CACHE_PATH.exists()) or HASH_PATH.read_text() != current_hash:
+        return None
+    try:
+        with open(CACHE_PATH, "rb") as f:
+            cached_hash, table = pickle.load(f)
+    except (OSError, EOFError, TypeError, ValueError, pickle.UnpicklingError):
+        return None
+    return table if cached_hash == current_hash else None
+
+def write_population_cache(current_hash, table):
+    atomic_write_bytes(CACHE_PATH, pickle.dumps((current_hash, table)))
+    atomic_write_bytes(HASH_PATH, current_hash.encode())
+
+def neighborhood_selection_ui(df, data_digest):
+    st.header("📍 Phase 2: Neighborhood Selection")
+    # Every tab body runs on every rerun, so the Phase 2 module is only imported once the user opens the step
+    if st.button("Select Neighborhoods by Province"):
+        st.session_state['phase2_open'] = True
+    if not (st.session_state.get('phase2_open') or st.session_state.get('phase2_selection')):
+        st.caption("Optional: restrict Phase 3 to uploaded lists of Metropol and Other provinces.")
+        return
+    from phase2_neighborhood_selection import (
+        PROVINCE_LIST_TYPES, export_neighborhood_codes, read_nuts3_codes, selection_summary, split_by_statu_cat,
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        metropol_file = st.file_uploader("Upload Metropol Provinces (CSV, Excel or text)", type=PROVINCE_LIST_TYPES,
+                                         key="metropol")
+    with col2:
+        other_file = st.file_uploader("Upload Other Provinces (CSV, Excel or text)", type=PROVINCE_LIST_TYPES,
+                                      key="other")
+
+    if metropol_file and other_file:
+        if st.button("Generate Neighborhood Lists"):
+            phase2_key = (data_digest, metropol_file.name, bytes_digest(metropol_file.getvalue()),
+                          other_file.name, bytes_digest(other_file.getvalue()))
+            try:
+                metropol_nuts3, other_nuts3 = read_nuts3_codes(metropol_file), read_nuts3_codes(other_file)
+                rows, index = stages.run('phase2_filter', phase2_key, select_neighborhood_rows, df, metropol_nuts3, other_nuts3)
+            except SamplingError as e:
+                st.error(str(e))
+                return
+            # Used in Phase 3; the session keeps row positions into the shared frame, not a filtered copy
+            st.session_state['phase2_selection'] = {
+                'key': phase2_key, 'rows': rows, 'index': index,
+                'metropol_nuts3': metropol_nuts3, 'other_nuts3': other_nuts3,
+            }
+            selected = df.iloc[rows]
+            st.info(selection_summary(selected))
+
+            df_metropol, df_other = split_by_statu_cat(selected, index)
+            for part, filename in ((df_metropol, "metropol.txt"), (df_other, "other.txt")):
+                try:
+                    exported = export_neighborhood_codes(part, filename)
+                except SamplingError as e:
+                    st.error(str(e))
+                    continue
+                st.success(f"Exported: {filename} ({exported} records)")
+
+def show_final_sampling(results):
+    metropol_sample = results['metropol_sample']
+    st.subheader("📍 Road 1: Metropolitan Sampling")
+    st.write("Sampled Metropolitan Neighborhoods:")
+    if not metropol_sample.empty:
+        st.dataframe(metropol_sample[['province', 'district', 'neighborhood_code', 'population', 'Inclusion_Probability',
+                                      'Base_Weight']])
+
+    final_other = results['other_sample']
+    st.subheader("📍 Road 2: Other Sampling")
+    st.write("Sampled Other Neighborhoods:")
+    if not final_other.empty and all(col in final_other.columns for col in ['province', 'district', 'neighborhood_code', 'neighborhood_status', 'population']):
+        st.dataframe(final_other[['province', 'district', 'neighborhood_code', 'neighborhood_status', 'population',
+                                  'Inclusion_Probability', 'Base_Weight']])
+    else:
+        st.warning("⚠️ No valid neighborhoods were selected or expected columns are missing.")
+    # Draws run in job threads, whose log records never reach the page, so shortfalls are shown from the results
+    if results['shortfalls']:
+        shortfalls = pd.DataFrame(results['shortfalls'], columns=['Group', 'ILCE_STATU', 'nuts3', 'district'])
+        st.warning(f"⚠️ {len(shortfalls)} chosen district(s) have fewer neighborhoods than their share; "
+                   "all of their neighborhoods were taken.")
+        st.dataframe(shortfalls)
+
+    if not final_other.empty:
+        st.subheader("📊 Neighborhoods by ILCE_STATU")
+        ilce_summary = final_other.groupby('status').size().reset_index(name='count')
+        ilce_summary['status'] = ilce_summary['status'].map({1: "Central", 2: "Outer"})
+        import plotly.express as px
+        with span('plotly_chart'):
+            fig = px.bar(ilce_summary, x='status', y='count', title='Allocated Neighborhoods by ILCE_STATU')
+            st.plotly_chart(fig, use_container_width=True)
 
-# Load dataset
-@st.cache_data
-def cached_load_data():
-    return load_data(DEFAULT_DATA_PATH, config, is_csv=False)
+def sweep_heatmap(sweep, measure):
+    grid = sweep_summary(sweep).pivot(index='Interviews_per_Neighborhood', columns='Total_Sample_Size', values=measure)
+    import plotly.express as px
+    # Kept as a plain dict so the stage cache holds data, not a plotly object graph
+    return px.imshow(grid, aspect='auto', color_continuous_scale='Blues', text_auto=True,
+                     labels={'x': 'Total sample size', 'y': 'Interviews per neighborhood', 'color': measure}).to_dict()
+
+def load_population_distribution(current_hash):
+    table = read_population_cache(current_hash)
+    count('population_pickle', hit=table is not None)
+    if table is not None:
+        st.info("Using cached population distribution.")
+        return table
+    table = run_or_stop(create_population_distribution, df, data_config)
+    write_population_cache(current_hash, table)
+    st.success("Population distribution calculated and cached.")
+    return table
+
+# Every stage is memoized per session by its exact inputs; keys chain, so only invalidated stages rerun
+stages = st.session_state.setdefault('stage_cache', StageCache())
+stages.start_run()
 
 try:
-    df = cached_load_data()
+    source_key = dataset_key(entry)
+    df, data_digest, stratum_index = stages.run('load_data', source_key, load_shared_dataset, source_key, data_config)
     # Optional debug output
     if st.checkbox("🔍 Show raw column names (debug)"):
         st.write(df.columns.tolist())
 except Exception as e:
-    st.error(f"Failed to load default dataset: {e}")
+    st.error(f"Failed to load dataset {dataset_name}: {e}")
     st.stop()
 
 # Cache population distribution
-current_hash = compute_hash(df, config)
-if HASH_PATH.exists() and HASH_PATH.read_text() == current_hash and CACHE_PATH.exists():
-    population_distribution = pickle.load(open(CACHE_PATH, "rb"))
-    st.info("Using cached population distribution.")
-else:
-    population_distribution = create_population_distribution(df, config)
-    with open(CACHE_PATH, "wb") as f:
-        pickle.dump(population_distribution, f)
-    HASH_PATH.write_text(current_hash)
-    st.success("Population distribution calculated and cached.")
+current_hash = compute_hash(data_digest, data_config)
+population_distribution = stages.run('population_distribution', current_hash, load_population_distribution, current_hash)
 
 # Tabs for each phase
-tabs = st.tabs(["Phase 1: Sampling Frame", "Phase 2: Neighborhood Selection", "Phase 3 & 4: Final Sampling"])
+tab_names = ["Phase 1: Sampling Frame", "Phase 2: Neighborhood Selection", "Phase 3 & 4: Final Sampling",
+             "What-if Sweep"]
+if len(entries) > 1:
+    tab_names.append("Dataset Comparison")
+tabs = st.tabs(tab_names)
 
 with tabs[0]:
     st.header("📌 Phase 1: Sampling Frame")
-    col1, col2 = st.columns(2)
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
         total_sample_size = st.number_input("Total Sample Size", min_value=1, value=1000)
     with col2:
         interviews_per_neighborhood = st.number_input("Interviews per Neighborhood", min_value=1, value=10)
+    with col3:
+        allocation_method = st.selectbox("Allocation", ALLOCATION_METHODS, key="allocation_method",
+                                         help="Neyman weights each Group by its population times the spread "
+                                              "of its neighborhood populations.")
+    with col4:
+        min_per_group = st.number_input("Minimum Interviews per Group", min_value=0, value=0)
 
-    sampling_frame = compute_sampling_frame(population_distribution, total_sample_size, interviews_per_neighborhood)
+    frame_key = (current_hash, total_sample_size, interviews_per_neighborhood, allocation_method, min_per_group)
+    dispersion = None
+    if allocation_method == 'neyman':
+        dispersion = population_dispersion(df, population_distribution['Group'])
+    sampling_frame = run_or_stop(stages.run, 'sampling_frame', frame_key, compute_sampling_frame,
+                                 population_distribution, total_sample_size, interviews_per_neighborhood,
+                                 method=allocation_method, dispersion=dispersion, min_per_stratum=min_per_group)
 
     st.subheader("Population Distribution")
     st.dataframe(population_distribution)
@@ -103,53 +294,226 @@ with tabs[0]:
     with st.expander("Preview: Sampling Frame (first 5 rows)"):
         st.dataframe(sampling_frame.head())
 
-    outputs, zip_buffer = generate_outputs({
+    output_format = st.selectbox("Output format", OUTPUT_FORMATS, key="output_format")
+    zip_path = run_or_stop(stages.run, 'phase1_archive', (frame_key, output_format), cached_archive, {
         "population_distribution.xlsx": population_distribution,
         "sampling_frame.xlsx": sampling_frame
-    })
+    }, output_format, valid=archive_exists)
+    st.success("Outputs generated successfully.")
 
-    st.download_button(
-        label="📥 Download All Outputs (ZIP)",
-        data=zip_buffer.getvalue(),
-        file_name="sampling_outputs.zip",
-        mime="application/zip"
-    )
+    with open(zip_path, "rb") as zip_file:
+        st.download_button(
+            label="📥 Download All Outputs (ZIP)",
+            data=zip_file,
+            file_name="sampling_outputs.zip",
+            mime="application/zip"
+        )
 
     if st.button("🔄 Reset Cache"):
         if CACHE_PATH.exists():
             CACHE_PATH.unlink()
         if HASH_PATH.exists():
             HASH_PATH.unlink()
-        st.experimental_rerun()
+        stages.clear()
+        st.rerun()
 
 with tabs[1]:
-    neighborhood_selection_ui(df)
-    if 'df_filtered' in st.session_state:
-        df = st.session_state['df_filtered']
+    neighborhood_selection_ui(df, data_digest)
+    selection = st.session_state.get('phase2_selection')
+    if selection and selection['key'][0] != data_digest:
+        # Made on another dataset: its row positions and index belong to that dataset's frame
+        del st.session_state['phase2_selection']
+        selection = None
+    sample_base_key = selection['key'] if selection else data_digest
+
+# Phase 3/4 runs on a worker pool shared by every session: identical designs (same inputs and seed) run once,
+# and finished results stay in a bounded LRU, so the page never blocks on a draw
+@st.cache_resource
+def job_store():
+    return JobStore()
+
+def final_sampling(progress, df, sampling_frame, selection, stratum_index, seed, districts_per_cell, incremental,
+                   previous):
+    # The Phase 2 subset is only materialized here, inside the job, and dropped once the sample is drawn
+    if selection:
+        from phase2_neighborhood_selection import filter_by_nuts3
+        phase3_df = filter_by_nuts3(df, selection['metropol_nuts3'], selection['other_nuts3'], selection['rows'])
+        return run_final_sampling(phase3_df, sampling_frame, selection['index'], seed, progress, districts_per_cell,
+                                  incremental, previous)
+    return run_final_sampling(df, sampling_frame, stratum_index, seed, progress, districts_per_cell, incremental,
+                              previous)
+
+def final_archive(progress, tables, fmt):
+    progress(0, 1, "Writing output files")
+    return cached_archive(tables, fmt)
+
+@st.fragment(run_every=0.5)
+def job_progress(job, title):
+    """Progress and a cancel button while `job` runs; reruns the page once it has finished."""
+    if not job.active:
+        st.rerun()
+    st.progress(job.fraction, text=f"{title}: {job.label} ({job.done}/{job.total})" if job.total else title)
+    if st.button("Cancel", key=f"cancel_{title}"):
+        job.cancel()
+
+def show_job_state(job, title):
+    """True once `job` has a result; otherwise shows its progress, cancellation or error."""
+    if job.active:
+        job_progress(job, title)
+    elif job.status == 'cancelled':
+        st.warning(f"{title} was cancelled.")
+    elif job.status == 'failed':
+        st.error(job.error)
+    return job.status == 'done'
 
 with tabs[2]:
     st.header("🎯 Phase 3 & 4: Final Sampling and Validation")
+    col1, col2 = st.columns(2)
+    with col1:
+        seed = st.number_input("Random Seed", min_value=0, value=42)
+    with col2:
+        districts_per_cell = st.number_input("Districts per Other cell", min_value=1, value=1,
+                                             help="Districts drawn (PPS) in each Group x ILCE_STATU cell of the Other "
+                                                  "strata; the cell's neighborhoods are spread evenly over them.")
+    incremental = st.checkbox("Incremental re-sampling", value=False,
+                              help="Draw with permanent random numbers per neighborhood and keep the draws of every "
+                                   "Group x STATU_CAT whose plan and neighborhoods did not change since the last "
+                                   "incremental run; changed strata are redrawn or topped up.")
+    # An incremental result does not depend on the previous state, only on how fast it is reached
+    sample_key = (sample_base_key, frame_key, seed, districts_per_cell, incremental)
     if st.button("Run Final Sampling"):
-        metropol_sample = sample_metropol_neighborhoods(df, sampling_frame)
-        other_sample = sample_other_neighborhoods(df, sampling_frame)
+        st.session_state['phase3_key'] = sample_key
+        st.session_state['phase3_job'] = job_store().submit(sample_key, final_sampling, df, sampling_frame,
+                                                            selection, stratum_index, seed, districts_per_cell,
+                                                            incremental, st.session_state.get('phase3_state'))
 
-        final_sample = pd.concat([metropol_sample, other_sample], ignore_index=True)
+    if st.session_state.get('phase3_key') is not None and st.session_state['phase3_key'] != sample_key:
+        st.info("Inputs changed since the last run. Click \"Run Final Sampling\" to draw a new sample.")
+    elif st.session_state.get('phase3_key') == sample_key and show_job_state(st.session_state['phase3_job'],
+                                                                             "Final sampling"):
+        results = st.session_state['phase3_job'].result
+        if 'state' in results:
+            st.session_state['phase3_state'] = results['state']
+            st.caption(f"Incremental run: {len(results['redrawn'])} of {len(results['state']['strata'])} strata "
+                       "were drawn; the others were kept from the previous run.")
+        show_final_sampling(results)
 
+        merged_plan = results['plan_comparison']
         st.subheader("📋 Final Sample vs Plan")
-        comparison = final_sample.groupby('Group').size().reset_index(name='Sampled_Neighborhoods')
-        merged_plan = sampling_frame[['Group', 'Neighborhood_Count']].merge(comparison, on='Group', how='left').fillna(0)
-        merged_plan['Sampled_Neighborhoods'] = merged_plan['Sampled_Neighborhoods'].astype(int)
         with st.expander("Preview: Final Sample Plan Comparison (first 5 rows)"):
             st.dataframe(merged_plan.head())
 
-        outputs_final, zip_final = generate_outputs({
-            "final_sample.xlsx": final_sample,
+        archive_job = job_store().submit(('final_archive', sample_key, output_format), final_archive, {
+            "final_sample.xlsx": results['final_sample'],
             "sample_plan_vs_actual.xlsx": merged_plan
-        })
+        }, output_format, valid=archive_exists)
+        if show_job_state(archive_job, "Output files"):
+            st.success("Outputs generated successfully.")
+            with open(archive_job.result, "rb") as zip_file:
+                st.download_button(
+                    label="📥 Download Final Sampling Outputs (ZIP)",
+                    data=zip_file,
+                    file_name="final_sampling_outputs.zip",
+                    mime="application/zip"
+                )
 
+with tabs[3]:
+    st.header("🧮 What-if Sweep")
+    st.write("Sampling frames for a whole grid of sample sizes and interviews per neighborhood, using the "
+             "allocation settings of Phase 1. The grid is computed once; moving the point sliders only reads it.")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        size_range = st.slider("Total sample size range", 100, 10000, (500, 3000), step=100)
+    with col2:
+        size_step = st.number_input("Sample size step", min_value=10, value=250, step=10)
+    with col3:
+        interviews_range = st.slider("Interviews per neighborhood range", 1, 30, (6, 14))
+    sweep_sizes = tuple(range(size_range[0], size_range[1] + 1, size_step))
+    sweep_interviews = tuple(range(interviews_range[0], interviews_range[1] + 1))
+    sweep_key = (frame_key, sweep_sizes, sweep_interviews)
+    # The grid and its plotly heatmap are only built once asked for, not on every first render
+    if st.button("Run Sweep"):
+        st.session_state['run_sweep'] = True
+    if st.session_state.get('run_sweep'):
+        sweep = run_or_stop(stages.run, 'sweep', sweep_key, sweep_frames, population_distribution, sweep_sizes,
+                            sweep_interviews, allocation_method, dispersion, min_per_group)
+
+        measure = st.selectbox("Measure", SWEEP_MEASURES, key="sweep_measure")
+        st.plotly_chart(stages.run('sweep_heatmap', (sweep_key, measure), sweep_heatmap, sweep, measure),
+                        use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            point_size = st.select_slider("Sample size", sweep_sizes, value=sweep_sizes[len(sweep_sizes) // 2])
+        with col2:
+            point_interviews = st.select_slider("Interviews", sweep_interviews,
+                                                value=sweep_interviews[len(sweep_interviews) // 2])
+        point = sweep[(sweep['Total_Sample_Size'] == point_size)
+                      & (sweep['Interviews_per_Neighborhood'] == point_interviews)]
+        st.dataframe(point.drop(columns=['Total_Sample_Size', 'Interviews_per_Neighborhood'])
+                     .round({'Quota': 2, 'Rounding_Error': 2}), hide_index=True)
         st.download_button(
-            label="📥 Download Final Sampling Outputs (ZIP)",
-            data=zip_final.getvalue(),
-            file_name="final_sampling_outputs.zip",
-            mime="application/zip"
+            label="📥 Download Sweep (CSV)",
+            data=stages.run('sweep_csv', sweep_key, lambda: sweep.to_csv(index=False).encode('utf-8')),
+            file_name="sweep.csv",
+            mime="text/csv"
         )
+
+if len(entries) > 1:
+    with tabs[4]:
+        st.header("📅 Dataset Comparison")
+        st.write("Phase 1 plans of every registered dataset for the sample size and interviews per neighborhood "
+                 "set in Phase 1. Each dataset is loaded and cached on its own, so only a changed file is reloaded.")
+        if st.button("Compare Datasets"):
+            st.session_state['compare_datasets'] = True
+        if st.session_state.get('compare_datasets'):
+            keys = {item['name']: run_or_stop(dataset_key, item) for item in entries}
+            loaded = run_or_stop(load_datasets, entries,
+                                 load=lambda item: load_shared_dataset(keys[item['name']], item['config']))
+            plans = {
+                item['name']: run_or_stop(stages.run, f"plan:{item['name']}",
+                                          (keys[item['name']], config_digest(item['config']),
+                                           total_sample_size, interviews_per_neighborhood),
+                                          build_plan, loaded[item['name']][0], item['config'],
+                                          total_sample_size, interviews_per_neighborhood)
+                for item in entries
+            }
+            comparison = compare_plans(plans)
+            st.dataframe(comparison, hide_index=True)
+            st.download_button(
+                label="📥 Download Comparison (CSV)",
+                data=comparison.to_csv(index=False).encode('utf-8'),
+                file_name="dataset_comparison.csv",
+                mime="text/csv"
+            )
+
+with st.expander("⏱️ Stage timings and caching"):
+    timings = pd.DataFrame(stages.log, columns=['stage', 'cached', 'seconds'])
+    timings['ms'] = (timings.pop('seconds') * 1000).round(1)
+    st.dataframe(timings, hide_index=True)
+    shared_mb = memory_footprint((df, stratum_index)) / 2**20
+    session_mb = memory_footprint(st.session_state.to_dict(), exclude=(df, stratum_index)) / 2**20
+    st.caption(f"Memory: {shared_mb:.1f} MB shared dataset (one copy per server process), "
+               f"{session_mb:.1f} MB held by this session.")
+
+with st.expander("🩺 Diagnostics"):
+    st.checkbox("Record diagnostics on every rerun", key="diagnostics",
+                help="Per-function timings, rows processed and cache hits of the pipeline modules.")
+    st.checkbox("Track memory deltas (slower)", key="diagnostics_memory")
+    st.selectbox("Profiler", ('none', *PROFILERS), key="diagnostics_profiler")
+    if recorder is None:
+        st.caption("Recording is off. Turn it on, then use the app; each rerun is reported here.")
+    else:
+        recorder.stop()
+        st.caption(f"Last rerun: {recorder.seconds * 1000:.0f} ms until this panel.")
+        st.dataframe(recorder.summary_frame(), hide_index=True)
+        st.dataframe(recorder.counters_frame(), hide_index=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("📥 Metrics (JSON)", data=json.dumps(recorder.summary(), indent=2),
+                               file_name="metrics.json", mime="application/json")
+        with col2:
+            st.download_button("📥 Trace events (chrome://tracing)", data=json.dumps(recorder.trace_events()),
+                               file_name="trace.json", mime="application/json")
+        if recorder.profile:
+            st.code(recorder.profile_text(), language=None)
@@ -1,26 +1,104 @@
 # output_generator.py
 import pandas as pd
-import streamlit as st
 from io import BytesIO
+from pathlib import Path
+import os
+import time
 import zipfile
 
-def generate_outputs(output_dict):
+from fingerprint import combine_digests, frame_digest
+from instrumentation import count, instrumented
+from utils import SamplingError, atomic_open, get_logger
+
+logger = get_logger(__name__)
+
+OUTPUT_FORMATS = ('xlsx', 'csv', 'parquet')
+OUTPUT_CACHE_DIR = Path(".cache") / "outputs"
+OUTPUT_CACHE_SIZE = 32
+EXCEL_CHUNK_ROWS = 10_000
+
+def _write_excel(df, fileobj):
+    # Excel writers are imported on first use; CSV and Parquet outputs never load them
+    try:
+        import xlsxwriter
+    except ImportError:  # fall back to pandas + openpyxl
+        df.to_excel(fileobj, index=False, engine='openpyxl')
+        return
+    # constant_memory flushes each row as soon as the next one starts, so rows go out strictly in order
+    workbook = xlsxwriter.Workbook(fileobj, {'constant_memory': True})
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], workbook.add_format({'bold': True}))
+    row_number = 1
+    for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXCEL_CHUNK_ROWS].astype(object)
+        for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+            worksheet.write_row(row_number, 0, row)
+            row_number += 1
+    workbook.close()
+
+@instrumented
+def write_table(df, fileobj, fmt='xlsx'):
+    """Write one table to a binary file object, which may be an unseekable ZIP entry."""
+    if fmt == 'xlsx':
+        _write_excel(df, fileobj)
+    elif fmt == 'csv':
+        df.to_csv(fileobj, index=False, encoding='utf-8')
+    elif fmt == 'parquet':
+        df.to_parquet(fileobj, index=False)
+    else:
+        raise SamplingError(f"Unsupported output format: {fmt}")
+
+@instrumented
+def write_archive(output_dict, target, fmt='xlsx'):
+    """Stream every table straight into its own ZIP entry of `target` (a path or binary file object).
+
+    Entry names keep their stem and take the extension of `fmt`, e.g.
+    'final_sample.xlsx' becomes 'final_sample.csv' for fmt='csv'.
+    """
     try:
-        buffer = BytesIO()
-        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as z:
             for filename, df in output_dict.items():
                 if df is None or df.empty:
-                    st.warning(f"{filename} is empty, skipping.")
+                    logger.warning("%s is empty, skipping.", filename)
                     continue
-                excel_buffer = BytesIO()
-                df.to_excel(excel_buffer, index=False, engine='openpyxl')
-                excel_buffer.seek(0)
-                z.writestr(filename, excel_buffer.getvalue())
+                info = zipfile.ZipInfo(f"{Path(filename).stem}.{fmt}", date_time=time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with z.open(info, "w", force_zip64=True) as entry:
+                    write_table(df, entry, fmt)
+    except SamplingError:
+        raise
+    except Exception as e:
+        raise SamplingError(f"Error generating outputs: {str(e)}") from e
+    logger.info("Outputs generated successfully.")
 
-        buffer.seek(0)
-        st.success("Outputs generated successfully.")
-        return output_dict, buffer
+def generate_outputs(output_dict, fmt='xlsx'):
+    buffer = BytesIO()
+    write_archive(output_dict, buffer, fmt)
+    buffer.seek(0)
+    return output_dict, buffer
 
-    except Exception as e:
-        st.error(f"Error generating outputs: {str(e)}")
-        st.stop()
+def outputs_digest(output_dict, fmt='xlsx'):
+    return combine_digests(fmt, *(f"{name}:{frame_digest(df) if df is not None else ''}"
+                                  for name, df in output_dict.items()))
+
+def cached_archive(output_dict, fmt='xlsx', cache_dir=OUTPUT_CACHE_DIR):
+    """Path to a ZIP of `output_dict`, reused as long as the tables and format are unchanged."""
+    cache_dir = Path(cache_dir)
+    path = cache_dir / f"{outputs_digest(output_dict, fmt)[:24]}.zip"
+    reuse = path.exists()
+    count('output_archive', hit=reuse)
+    if reuse:
+        os.utime(path)
+        logger.info("Reusing outputs from %s", path)
+        return path
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with atomic_open(path) as f:
+        write_archive(output_dict, f, fmt)
+    _prune_cache(cache_dir)
+    return path
+
+def _prune_cache(cache_dir, keep=OUTPUT_CACHE_SIZE):
+    archives = sorted(cache_dir.glob("*.zip"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for stale in archives[keep:]:
+        stale.unlink(missing_ok=True)
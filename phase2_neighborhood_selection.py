@@ -1,63 +1,111 @@
 # phase_neighborhood_selection.py
+import os
+import re
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import streamlit as st
 
-def filter_by_nuts3(df, metropol_file, other_file):
-    try:
-        metropol_nuts3 = pd.read_csv(metropol_file)['NUTS3KODU'].dropna().unique().tolist()
-        other_nuts3 = pd.read_csv(other_file)['NUTS3KODU'].dropna().unique().tolist()
-        all_selected = set(metropol_nuts3 + other_nuts3)
+from instrumentation import instrumented
+from stratum_index import stratum_children, stratum_rows, union_rows
+from utils import SamplingError, atomic_write_chunks, get_logger
 
-        filtered = df[df['nuts3'].isin(all_selected)].copy()
-        filtered['GroupLabel'] = filtered['nuts3'].apply(
-            lambda x: 'Metropol' if x in metropol_nuts3 else 'Other'
-        )
+logger = get_logger(__name__)
 
-        st.session_state['df_filtered'] = filtered  # Used in Phase 3
+PROVINCE_LIST_TYPES = ('csv', 'txt', 'xlsx')
+EXPORT_CHUNK_ROWS = 65536
 
-        df_metropol = filtered[filtered['STATU_CAT'] == 'BŞ']
-        df_other = filtered[filtered['STATU_CAT'] == 'M&D']
+def _read_text_codes(file):
+    data = file.read() if hasattr(file, 'read') else Path(file).read_bytes()
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    return [code for code in re.split(r'[\s,;]+', text) if code and code != 'NUTS3KODU']
 
-        provinces = filtered['province'].nunique()
-        districts = filtered['district'].nunique()
-        population = filtered['population'].sum()
-        st.info(f"Filtered data covers {provinces} provinces, {districts} districts, total population: {population:,}")
+def read_nuts3_codes(file):
+    """Unique NUTS3 codes of a province list, in file order.
+
+    `file` is a path or an uploaded file. CSV and Excel lists need a
+    NUTS3KODU column; a .txt list is plain codes separated by newlines,
+    commas or spaces.
+    """
+    suffix = Path(str(getattr(file, 'name', file))).suffix.lower()
+    try:
+        if suffix == '.txt':
+            return list(dict.fromkeys(_read_text_codes(file)))
+        table = pd.read_excel(file) if suffix in ('.xlsx', '.xls') else pd.read_csv(file)
+        return table['NUTS3KODU'].dropna().unique().tolist()
+    except Exception as e:
+        raise SamplingError(f"Error reading province list: {str(e)}") from e
 
-        return df_metropol, df_other
+def _in_provinces(nuts3, codes):
+    """Boolean membership of each row's NUTS3 code in `codes`, hashed once per distinct province."""
+    codes = pd.Index(codes).unique()
+    if isinstance(nuts3.dtype, pd.CategoricalDtype):
+        # Test the ~81 categories, then look each row up by its category code (-1, missing, hits the False slot)
+        member = np.append(nuts3.cat.categories.isin(codes), False)
+        return member[nuts3.cat.codes.to_numpy()]
+    return np.asarray(nuts3.isin(codes), dtype=bool)
 
+@instrumented
+def select_rows(df, metropol_nuts3, other_nuts3):
+    """Positions (in frame order) of the rows in any of the listed provinces."""
+    try:
+        return np.flatnonzero(_in_provinces(df['nuts3'], [*metropol_nuts3, *other_nuts3]))
     except Exception as e:
-        st.error(f"Error during NUTS3 filtering: {str(e)}")
-        return None, None
+        raise SamplingError(f"Error during NUTS3 filtering: {str(e)}") from e
 
+@instrumented
+def filter_by_nuts3(df, metropol_nuts3, other_nuts3, rows=None):
+    """The selected rows of `df` with their GroupLabel; pass `rows` from select_rows to skip the lookup."""
+    if rows is None:
+        rows = select_rows(df, metropol_nuts3, other_nuts3)
+    try:
+        filtered = df.iloc[rows]
+        labels = np.where(_in_provinces(filtered['nuts3'], metropol_nuts3), 0, 1)
+        filtered = filtered.assign(GroupLabel=pd.Categorical.from_codes(labels, ['Metropol', 'Other']))
+    except Exception as e:
+        raise SamplingError(f"Error during NUTS3 filtering: {str(e)}") from e
+
+    logger.info(selection_summary(filtered))
+    return filtered
+
+def selection_summary(filtered):
+    provinces = filtered['province'].nunique()
+    districts = filtered['district'].nunique()
+    population = filtered['population'].sum()
+    return f"Filtered data covers {provinces} provinces, {districts} districts, total population: {population:,}"
+
+def split_by_statu_cat(filtered, index):
+    """Metropol (BŞ) and Other (M&D) rows of the filtered frame, via its stratum index."""
+    groups = stratum_children(index)
+    df_metropol = filtered.iloc[union_rows(index, [(g, 'BŞ') for g in groups])]
+    df_other = filtered.iloc[union_rows(index, [(g, 'M&D') for g in groups])]
+    return df_metropol, df_other
+
+def neighborhood_codes(df):
+    """Distinct neighborhood codes as text, sorted as text (the order of the exported lists)."""
+    codes = df['neighborhood_code'].dropna().to_numpy()
+    return np.sort(pd.unique(codes).astype(str))
+
+def _code_lines(codes):
+    for start in range(0, len(codes), EXPORT_CHUNK_ROWS):
+        yield (os.linesep.join(codes[start:start + EXPORT_CHUNK_ROWS]) + os.linesep).encode('utf-8')
+
+@instrumented
 def export_neighborhood_codes(df, filename):
+    """Write one code per line to `filename`, streamed in chunks and replaced atomically."""
     try:
-        codes = df['neighborhood_code'].dropna().astype(str).drop_duplicates().sort_values()
-        codes.to_csv(filename, index=False, header=False, encoding='utf-8')
-        st.success(f"Exported: {filename} ({len(codes)} records)")
+        codes = neighborhood_codes(df)
+        atomic_write_chunks(filename, _code_lines(codes))
     except Exception as e:
-        st.error(f"Failed to export {filename}: {str(e)}")
-
-def check_status_distribution(df):
-    if df is None or df.empty:
-        return
-    status1_counts = df[(df['STATU_CAT'] == 'M&D') & (df['status'] == 1)].groupby('Group').size()
-    if status1_counts.empty:
-        st.warning("⚠️ No neighborhoods with status=1 (Central) found in 'Other' strata for some groups.")
-
-# ---- UI Integration ----
-def neighborhood_selection_ui(df):
-    st.header("📍 Phase 2: Neighborhood Selection")
-
-    col1, col2 = st.columns(2)
-    with col1:
-        metropol_file = st.file_uploader("Upload Metropol Provinces (CSV)", type="csv", key="metropol")
-    with col2:
-        other_file = st.file_uploader("Upload Other Provinces (CSV)", type="csv", key="other")
-
-    if metropol_file and other_file:
-        if st.button("Generate Neighborhood Lists"):
-            df_metropol, df_other = filter_by_nuts3(df, metropol_file, other_file)
-            if df_metropol is not None and df_other is not None:
-                export_neighborhood_codes(df_metropol, "metropol.txt")
-                export_neighborhood_codes(df_other, "other.txt")
-                check_status_distribution(st.session_state['df_filtered'])
+        raise SamplingError(f"Failed to export {filename}: {str(e)}") from e
+    logger.info("Exported: %s (%d records)", filename, len(codes))
+    return len(codes)
+
+def check_status_distribution(index):
+    if index is None or index['n_rows'] == 0:
+        return True
+    status1_groups = [g for g in stratum_children(index) if len(stratum_rows(index, g, 'M&D', 1))]
+    if not status1_groups:
+        logger.warning("⚠️ No neighborhoods with status=1 (Central) found in 'Other' strata for some groups.")
+        return False
+    return True
@@ -1,113 +1,225 @@
 # phase3_sampler.py
 import pandas as pd
 import numpy as np
-import streamlit as st
-from numpy.random import choice
 
-def sample_metropol_neighborhoods(df, sampling_frame):
-    st.subheader("📍 Road 1: Metropolitan Sampling")
+from allocation import allocate
+from instrumentation import instrumented
+from pps_sampler import pareto_keys, pps_inclusion, pps_sample_rows, top_n_per_stratum
+from stratum_index import build_stratum_index, leaf_population, stratum_population, stratum_rows
+from utils import SamplingError, get_logger
+
+logger = get_logger(__name__)
+
+def with_design_weights(sample, stages):
+    """`sample` with its first- and second-stage inclusion probabilities, their product and the base weight 1/π.
+
+    `stages` is a (rows, 2) array aligned with the rows of `sample`.
+    """
+    sample['Stage1_Probability'] = stages[:, 0]
+    sample['Stage2_Probability'] = stages[:, 1]
+    sample['Inclusion_Probability'] = stages[:, 0] * stages[:, 1]
+    sample['Base_Weight'] = 1.0 / sample['Inclusion_Probability']
+    return sample
+
+@instrumented
+def draw_metropol_positions(index, sampling_frame, weights, rng, probabilities=False, prn=None):
+    """Row positions of a PPS draw for every metropolitan (BŞ) stratum.
+
+    With `probabilities`, also returns a (rows, 2) array of stage
+    probabilities: neighborhoods are the first-stage units here, so the
+    second stage is always 1. With `prn` (a permanent random number per
+    row), the draw uses those instead of `rng`.
+    """
     metropol_strata = sampling_frame[sampling_frame['Neighborhood_BŞ'] > 0]
-    results = []
-
-    for _, row in metropol_strata.iterrows():
-        group = row['Group']
-        n = int(row['Neighborhood_BŞ'])
-        group_df = df[(df['Group'] == group) & (df['STATU_CAT'] == 'BŞ')]
-
-        if not group_df.empty:
-            sampled = group_df.sample(n=min(n, len(group_df)), weights=group_df['population'], random_state=42)
-            results.append(sampled)
-
-    sampled_df = pd.concat(results, ignore_index=True) if results else pd.DataFrame()
-    st.write("Sampled Metropolitan Neighborhoods:")
-    st.dataframe(sampled_df[['province', 'district', 'neighborhood_code', 'population']])
-    return sampled_df
+    row_groups = [stratum_rows(index, group, 'BŞ') for group in metropol_strata['Group']]
+    sizes = metropol_strata['Neighborhood_BŞ'].astype(int).to_numpy()
+    if not probabilities:
+        return pps_sample_rows(row_groups, sizes, weights, rng, prn=prn)
+    positions, inclusion = pps_sample_rows(row_groups, sizes, weights, rng, probabilities=True, prn=prn)
+    return positions, np.column_stack([inclusion, np.ones(len(inclusion))])
+
+@instrumented
+def draw_metropol_sample(df, sampling_frame, rng, index=None):
+    if index is None:
+        index = build_stratum_index(df)
+    positions, stages = draw_metropol_positions(index, sampling_frame, df['population'].to_numpy(), rng,
+                                                probabilities=True)
+    if len(positions) == 0:
+        return pd.DataFrame()
+    return with_design_weights(df.iloc[positions].reset_index(drop=True), stages)
+
+def sample_metropol_neighborhoods(df, sampling_frame, random_state=42, index=None):
+    return draw_metropol_sample(df, sampling_frame, np.random.default_rng(random_state), index)
 
 def simple_rounding_allocation(pop_matrix, total_neigh):
+    """Largest-remainder split of `total_neigh` over the cells of `pop_matrix`, in its shape."""
+    pop_matrix = np.asarray(pop_matrix)
     flat_pop = np.nan_to_num(pop_matrix.flatten().astype(float))
-    pop_total = flat_pop.sum()
-    if pop_total == 0:
-        return np.zeros_like(pop_matrix, dtype=int)
-
-    fractional_neigh = total_neigh * (flat_pop / pop_total)
-    floored = np.floor(fractional_neigh).astype(int)
-    remainders = fractional_neigh - floored
-    remaining = total_neigh - floored.sum()
-
-    if remaining > 0:
-        indices = np.argsort(-remainders)
-        for i in indices[:remaining]:
-            floored[i] += 1
-
-    return floored.reshape(pop_matrix.shape)
-
-def sample_other_neighborhoods(df, sampling_frame):
-    st.subheader("📍 Road 2: Other Sampling")
+    return allocate(flat_pop, total_neigh)[0].reshape(pop_matrix.shape)
+
+def district_cells(index, groups):
+    """Cell id of every district of the index: 2 * (position in `groups`) + (0 for ILCE_STATU 1, 1 for 2).
+
+    Districts outside the M&D strata of `groups` get -1.
+    """
+    group_codes, statu_codes, status_codes = (index['leaf_codes'][:, level] for level in range(3))
+    group_pos, statu_pos, status_pos = (np.full(len(level_uniques), -1) for level_uniques in index['uniques'][:3])
+    for lookup, level_uniques, wanted in ((group_pos, index['uniques'][0], groups),
+                                          (statu_pos, index['uniques'][1], ['M&D']),
+                                          (status_pos, index['uniques'][2], [1, 2])):
+        position = {value: i for i, value in enumerate(wanted)}
+        for code, value in enumerate(level_uniques):
+            lookup[code] = position.get(value, -1)
+
+    cell = 2 * group_pos[group_codes] + status_pos[status_codes]
+    return np.where((group_pos[group_codes] >= 0) & (statu_pos[statu_codes] >= 0) & (status_pos[status_codes] >= 0),
+                    cell, -1)
+
+def other_cells(index, sampling_frame):
+    """Groups of the Other draw and the neighborhoods needed in each of their ILCE_STATU 1/2 cells (flattened)."""
     other_strata = sampling_frame[sampling_frame['Neighborhood_M&D'] > 0]
-    all_results = []
-
-    for _, row in other_strata.iterrows():
-        
-        group = row['Group']
-        total_interviews = int(row['Neighborhood_M&D']) * 2
-        group_df = df[(df['Group'] == group) & (df['STATU_CAT'] == 'M&D')]
-        
-
-        if group_df.empty:
+    other_strata = other_strata[np.array([len(stratum_rows(index, group, 'M&D')) > 0 for group in other_strata['Group']],
+                                         dtype=bool)]
+    groups = other_strata['Group'].tolist()
+    totals = other_strata['Neighborhood_M&D'].astype(int).to_numpy()
+    status_pop = np.array([[stratum_population(index, group, 'M&D', ilce_status) for ilce_status in (1, 2)]
+                           for group in groups], dtype=float).reshape(len(groups), 2)
+    return groups, allocate(status_pop, totals).ravel()
+
+def draw_districts(index, cells, psu_sizes, rng, prn=None):
+    """First stage: PPS draw without replacement of `psu_sizes[c]` districts in every cell `c`, in one pass.
+
+    Districts are weighted by their population total from the index. The
+    result holds district positions (into index['leaf_codes']) ordered by
+    cell, then draw order, and their first-stage inclusion probabilities.
+    `prn` optionally gives a permanent random number per district to use
+    instead of `rng`.
+    """
+    population = leaf_population(index).astype(float)
+    strata = np.where(population > 0, cells, -1)
+    psu_sizes = np.asarray(psu_sizes, dtype=np.int64)
+    inclusion = pps_inclusion(strata, population, psu_sizes)
+    districts = top_n_per_stratum(strata, pareto_keys(inclusion, rng, prn), psu_sizes)
+    return districts, inclusion[districts]
+
+@instrumented
+def draw_other_positions(index, sampling_frame, weights, rng, progress=None, districts_per_cell=1,
+                         probabilities=False, prn=None, district_prn=None):
+    """Row positions of the two-stage Other (M&D) draw, plus the districts that fell short.
+
+    Every Group's M&D neighborhoods are split over ILCE_STATU 1/2 by
+    population. In each of these cells, `districts_per_cell` districts are
+    drawn PPS by population (fewer if the cell has fewer districts or needs
+    fewer neighborhoods), and the cell's neighborhoods are spread evenly
+    over them. Neighborhoods are then drawn PPS within the chosen
+    districts. Both stages cover every cell at once and use `rng` in turn.
+
+    A district is identified by its NUTS3 code and name, since names such as
+    'Merkez' repeat across provinces. Each shortfall is a (Group, status,
+    nuts3, district) tuple for a chosen district with fewer neighborhoods
+    than its share; all of them are taken.
+    `progress(done, total, label)` is called after each stage. With
+    `probabilities`, a (rows, 2) array of each row's district and
+    within-district inclusion probabilities is returned as well. `prn` and
+    `district_prn` (permanent random numbers per row and per district of
+    the index) replace `rng` in the two stages.
+    """
+    if districts_per_cell < 1:
+        raise SamplingError("At least one district per cell must be drawn.")
+    groups, needed = other_cells(index, sampling_frame)
+    cells = district_cells(index, groups)
+    districts, district_inclusion = draw_districts(index, cells, np.minimum(needed, districts_per_cell), rng,
+                                                   district_prn)
+    if progress is not None:
+        progress(1, 2, "districts")
+
+    # Even split of each cell's neighborhoods over its districts; the earlier draws take the remainder
+    cell = cells[districts]
+    chosen = np.bincount(cell, minlength=len(needed))
+    first = np.r_[0, np.cumsum(chosen)[:-1]]
+    rank = np.arange(len(districts)) - first[cell]
+    sizes = needed[cell] // chosen[cell] + (rank < needed[cell] % chosen[cell])
+
+    order = index['order']
+    row_groups = [order[start:stop] for start, stop in zip(index['leaf_starts'][districts].tolist(),
+                                                           index['leaf_stops'][districts].tolist())]
+    positions, inclusion = pps_sample_rows(row_groups, sizes, weights, rng, probabilities=True, prn=prn)
+    if progress is not None:
+        progress(2, 2, "neighborhoods")
+
+    available = np.array([np.count_nonzero(weights[rows] > 0) for rows in row_groups], dtype=np.int64)
+    shortfalls = [tuple(index['uniques'][level][index['leaf_codes'][district, level]] for level in (0, 2, 3, 4))
+                  for district in districts[available < sizes].tolist()]
+    if not probabilities:
+        return positions, shortfalls
+    # Drawn rows come grouped by district, in district order
+    stage1 = np.repeat(district_inclusion, np.minimum(available, sizes))
+    return positions, shortfalls, np.column_stack([stage1, inclusion])
+
+def design_inclusion(index, sampling_frame, weights, districts_per_cell=1):
+    """Inclusion probability of every row of the indexed frame under the Phase 3 design.
+
+    BŞ rows get their πps probability; M&D rows get their district's
+    probability times their own within the district. When a cell's
+    neighborhoods do not split evenly over its districts, a district's share
+    depends on its draw order, so the rows of that cell get NaN. Rows
+    outside the plan get 0. replication.py compares these with the
+    empirical selection rates.
+    """
+    weights = np.asarray(weights, dtype=float)
+    metropol_strata = sampling_frame[sampling_frame['Neighborhood_BŞ'] > 0]
+    row_groups = [stratum_rows(index, group, 'BŞ') for group in metropol_strata['Group']]
+    sizes = metropol_strata['Neighborhood_BŞ'].astype(int).tolist()
+    first_stage = [1.0] * len(row_groups)
+
+    groups, needed = other_cells(index, sampling_frame)
+    population = leaf_population(index).astype(float)
+    cells = np.where(population > 0, district_cells(index, groups), -1)
+    psu_sizes = np.minimum(needed, districts_per_cell)
+    district_inclusion = pps_inclusion(cells, population, psu_sizes)
+    chosen = np.minimum(psu_sizes, np.bincount(cells[cells >= 0], minlength=len(needed)))
+    uneven = np.zeros(index['n_rows'], dtype=bool)
+    for district in np.flatnonzero(cells >= 0).tolist():
+        cell = cells[district]
+        rows = index['order'][index['leaf_starts'][district]:index['leaf_stops'][district]]
+        if chosen[cell] == 0:
             continue
-
-        matrix = np.zeros((2, 1))
-        for i, ilce_status in enumerate([1, 2]):
-            subset = group_df[group_df['status'] == ilce_status]
-            matrix[i, 0] = subset['population'].sum() if not subset.empty else 0
-
-        total_neigh = int(row['Neighborhood_M&D'])
-        neigh_alloc = simple_rounding_allocation(matrix, total_neigh)
-        sample_parts = []
-
-        for i, ilce_status in enumerate([1, 2]):
-            sub_df = group_df[group_df['status'] == ilce_status]
-            districts = sub_df['district'].unique()
-
-            if len(districts) == 0:
-                continue
-
-            if ilce_status == 1:
-                selected_district = districts[0]
-            else:
-                pop_by_district = sub_df.groupby('district')['population'].sum()
-                probs = pop_by_district / pop_by_district.sum()
-                selected_district = choice(pop_by_district.index, p=probs)
-
-            needed = neigh_alloc[i, 0]
-            if needed == 0:
-                continue
-            cell_df = group_df[(group_df['status'] == ilce_status) &
-                        (group_df['district'] == selected_district)]
-            
-            if cell_df.empty:
-                cell_df = group_df[group_df['status'] == ilce_status]
-                st.warning(f"⚠️ No neighborhoods matched district {selected_district}. Fallback to group-wide sampling for ILCE_STATU={ilce_status}")
-            if not cell_df.empty:
-                    selected = cell_df.sample(n=min(needed, len(cell_df)), weights=cell_df['population'], random_state=42)
-                    sample_parts.append(selected)
-
-        if sample_parts:
-            all_results.append(pd.concat(sample_parts, ignore_index=True))
-
-    final_other = pd.concat(all_results, ignore_index=True) if all_results else pd.DataFrame()
-    
-    st.write("Sampled Other Neighborhoods:")
-    if not final_other.empty and all(col in final_other.columns for col in ['province', 'district', 'neighborhood_code', 'neighborhood_status', 'population']):
-        st.dataframe(final_other[['province', 'district', 'neighborhood_code', 'neighborhood_status', 'population']])
-    else:
-        st.warning("⚠️ No valid neighborhoods were selected or expected columns are missing.")
-
-    if not final_other.empty:
-        st.subheader("📊 Neighborhoods by ILCE_STATU")
-        ilce_summary = final_other.groupby('status').size().reset_index(name='count')
-        ilce_summary['status'] = ilce_summary['status'].map({1: "Central", 2: "Outer"})
-        import plotly.express as px
-        fig = px.bar(ilce_summary, x='status', y='count', title='Allocated Neighborhoods by ILCE_STATU')
-        st.plotly_chart(fig, use_container_width=True)
+        if needed[cell] % chosen[cell]:
+            uneven[rows] = True
+            continue
+        row_groups.append(rows)
+        sizes.append(needed[cell] // chosen[cell])
+        first_stage.append(district_inclusion[district])
+
+    probabilities = np.zeros(index['n_rows'])
+    if row_groups:
+        positions = np.concatenate(row_groups)
+        counts = [len(rows) for rows in row_groups]
+        strata = np.repeat(np.arange(len(row_groups)), counts)
+        strata[~(weights[positions] > 0)] = -1
+        probabilities[positions] = (pps_inclusion(strata, weights[positions], np.asarray(sizes))
+                                    * np.repeat(first_stage, counts))
+    probabilities[uneven] = np.nan
+    return probabilities
+
+@instrumented
+def draw_other_sample(df, sampling_frame, rng, index=None, progress=None, districts_per_cell=1):
+    if index is None:
+        index = build_stratum_index(df)
+    positions, shortfalls, stages = draw_other_positions(index, sampling_frame, df['population'].to_numpy(), rng,
+                                                         progress, districts_per_cell, probabilities=True)
+    if len(positions) == 0:
+        return pd.DataFrame(), shortfalls
+    return with_design_weights(df.iloc[positions].reset_index(drop=True), stages), shortfalls
+
+def log_shortfalls(shortfalls):
+    """One warning per (Group, status, nuts3, district) shortfall from draw_other_positions."""
+    for _, ilce_status, nuts3, district in shortfalls:
+        logger.warning("⚠️ District %s (%s, ILCE_STATU=%s) has fewer neighborhoods than its share; all were taken.",
+                       district, nuts3, ilce_status)
+
+def sample_other_neighborhoods(df, sampling_frame, index=None, random_state=42, districts_per_cell=1):
+    final_other, shortfalls = draw_other_sample(df, sampling_frame, np.random.default_rng(random_state), index,
+                                                districts_per_cell=districts_per_cell)
+    log_shortfalls(shortfalls)
     return final_other
@@ -0,0 +1,306 @@
+# pipeline.py
+"""Headless sampling pipeline: Phases 1-4 without Streamlit.
+
+Usage:
+    python -m pipeline --config config.yaml --sample-size 1000 --per-neighborhood 10 \
+        [--metropol metropol_provinces.csv --other other_provinces.csv] [--seed 42] [--output-dir outputs]
+        [--format xlsx|csv|parquet] [--allocation proportional|neyman] [--min-per-group 0]
+        [--districts-per-cell 1] [--incremental phase3_state.pkl]
+        [--chunk-rows 250000] [--metrics metrics.json] [--trace trace.json] [--trace-memory] [--profile cprofile|pyinstrument]
+"""
+import argparse
+import contextlib
+import logging
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from allocation import ALLOCATION_METHODS
+from data_cache import load_cached_data
+from instrumentation import PROFILERS, Recorder, instrumented
+from output_generator import OUTPUT_FORMATS, write_archive
+from sampling_frame import create_population_distribution, compute_sampling_frame, population_dispersion
+from stratum_index import build_stratum_index
+from utils import LOGGER_NAME, SamplingError, atomic_write_bytes, get_logger, load_config
+
+logger = get_logger(__name__)
+
+DEFAULT_DATA_PATH = "ADNKS_2023.xlsx"
+
+
+def load_dataset(config, data_path=DEFAULT_DATA_PATH):
+    """Phase 0: the cleaned, grouped dataset (served from the Parquet cache when fresh)."""
+    return load_cached_data(data_path, config, is_csv=str(data_path).lower().endswith('.csv'))
+
+
+def _check_plan_inputs(total_sample_size, interviews_per_neighborhood):
+    if total_sample_size <= 0:
+        raise SamplingError("Total sample size must be positive.")
+    if interviews_per_neighborhood <= 0:
+        raise SamplingError("Interviews per neighborhood must be positive.")
+
+
+@instrumented
+def build_plan(df, config, total_sample_size, interviews_per_neighborhood, method='proportional', min_per_stratum=0):
+    """Phase 1: population distribution and sampling frame."""
+    _check_plan_inputs(total_sample_size, interviews_per_neighborhood)
+    population_distribution = create_population_distribution(df, config)
+    dispersion = population_dispersion(df, population_distribution['Group']) if method == 'neyman' else None
+    sampling_frame = compute_sampling_frame(population_distribution, total_sample_size, interviews_per_neighborhood,
+                                            method=method, dispersion=dispersion, min_per_stratum=min_per_stratum)
+    return population_distribution, sampling_frame
+
+
+@instrumented
+def build_streamed_plan(data_path, config, total_sample_size, interviews_per_neighborhood, method='proportional',
+                        min_per_stratum=0, chunk_rows=None):
+    """Phase 1 from a CSV read in chunks, never holding the whole dataset; also returns the stratum summary."""
+    from chunked_loader import DEFAULT_CHUNK_ROWS, ingest_csv, summary_dispersion, summary_distribution
+
+    _check_plan_inputs(total_sample_size, interviews_per_neighborhood)
+    if not str(data_path).lower().endswith('.csv'):
+        raise SamplingError("Chunked ingestion reads CSV datasets only.")
+    summary = ingest_csv(data_path, config, chunk_rows or DEFAULT_CHUNK_ROWS)
+    population_distribution = summary_distribution(summary)
+    dispersion = summary_dispersion(summary, population_distribution['Group']) if method == 'neyman' else None
+    sampling_frame = compute_sampling_frame(population_distribution, total_sample_size, interviews_per_neighborhood,
+                                            method=method, dispersion=dispersion, min_per_stratum=min_per_stratum)
+    return population_distribution, sampling_frame, summary
+
+
+@instrumented
+def select_neighborhood_rows(df, metropol_nuts3, other_nuts3):
+    """Phase 2 without copying `df`: positions of the selected rows and the stratum index of that subset."""
+    from phase2_neighborhood_selection import check_status_distribution, select_rows
+
+    rows = select_rows(df, metropol_nuts3, other_nuts3)
+    index = build_stratum_index(df.iloc[rows])
+    check_status_distribution(index)
+    return rows, index
+
+
+def select_neighborhoods(df, metropol_nuts3, other_nuts3):
+    """Phase 2: restrict the frame to the listed NUTS3 provinces; returns the frame and its stratum index."""
+    from phase2_neighborhood_selection import filter_by_nuts3
+
+    rows, index = select_neighborhood_rows(df, metropol_nuts3, other_nuts3)
+    return filter_by_nuts3(df, metropol_nuts3, other_nuts3, rows), index
+
+
+@instrumented
+def compare_to_plan(final_sample, sampling_frame):
+    if final_sample.empty:
+        comparison = pd.DataFrame(columns=['Group', 'Sampled_Neighborhoods'])
+    else:
+        comparison = final_sample.groupby('Group', observed=True).size().reset_index(name='Sampled_Neighborhoods')
+    merged_plan = sampling_frame[['Group', 'Neighborhood_Count']].merge(comparison, on='Group', how='left').fillna(0)
+    merged_plan['Sampled_Neighborhoods'] = merged_plan['Sampled_Neighborhoods'].astype(int)
+    return merged_plan
+
+
+@instrumented
+def run_final_sampling(df, sampling_frame, index=None, seed=42, progress=None, districts_per_cell=1,
+                       incremental=False, previous=None):
+    """Phases 3 and 4: draw both roads from one RNG stream and compare the result with the plan.
+
+    `progress(done, total, label)`, if given, is called per step: the
+    metropolitan draw, the Other district and neighborhood stages, and the
+    comparison. With `incremental`, the draw uses permanent random numbers
+    and only strata that changed since `previous` (an earlier result's
+    'state') are drawn; the result then also holds 'state' and 'redrawn'.
+    """
+    from phase3_sampler import draw_metropol_sample, draw_other_sample, log_shortfalls
+
+    if index is None:
+        index = build_stratum_index(df)
+    report = progress or (lambda done, total, label: None)
+    steps = 3 if incremental else 4
+    extra = {}
+    if incremental:
+        from incremental import draw_incremental
+
+        metropol_sample, other_sample, shortfalls, state, redrawn = draw_incremental(
+            df, sampling_frame, index, seed, districts_per_cell, previous,
+            progress=lambda done, total, label: report(done, steps, label))
+        extra = {'state': state, 'redrawn': redrawn}
+    else:
+        rng = np.random.default_rng(seed)
+        report(0, steps, "Metropolitan strata")
+        metropol_sample = draw_metropol_sample(df, sampling_frame, rng, index)
+        other_sample, shortfalls = draw_other_sample(
+            df, sampling_frame, rng, index,
+            progress=lambda done, total, stage: report(1 + done, steps, f"Other strata: {stage}"),
+            districts_per_cell=districts_per_cell)
+    log_shortfalls(shortfalls)
+
+    final_sample = pd.concat([metropol_sample, other_sample], ignore_index=True)
+    report(steps - 1, steps, "Comparing with the plan")
+    return {
+        'metropol_sample': metropol_sample,
+        'other_sample': other_sample,
+        'shortfalls': shortfalls,
+        'final_sample': final_sample,
+        'plan_comparison': compare_to_plan(final_sample, sampling_frame),
+        **extra,
+    }
+
+
+def run_pipeline(config, total_sample_size, interviews_per_neighborhood, data_path=DEFAULT_DATA_PATH,
+                 metropol_nuts3=None, other_nuts3=None, seed=42, output_dir='outputs', fmt='xlsx',
+                 method='proportional', min_per_stratum=0, chunk_rows=None, districts_per_cell=1, state_path=None):
+    """Run Phases 1-4 end to end and write every output into `output_dir`.
+
+    With `state_path`, Phase 3 runs incrementally: strata unchanged since
+    the run saved there are reused, and the new state is saved back.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if chunk_rows:
+        return run_streamed_phase1(config, total_sample_size, interviews_per_neighborhood, data_path, output_dir,
+                                   fmt, method, min_per_stratum, chunk_rows)
+
+    df = load_dataset(config, data_path)
+    population_distribution, sampling_frame = build_plan(df, config, total_sample_size, interviews_per_neighborhood,
+                                                         method=method, min_per_stratum=min_per_stratum)
+    write_archive({
+        "population_distribution.xlsx": population_distribution,
+        "sampling_frame.xlsx": sampling_frame,
+    }, output_dir / "sampling_outputs.zip", fmt)
+
+    index = None
+    if metropol_nuts3 is not None and other_nuts3 is not None:
+        from phase2_neighborhood_selection import export_neighborhood_codes, split_by_statu_cat
+
+        df, index = select_neighborhoods(df, metropol_nuts3, other_nuts3)
+        df_metropol, df_other = split_by_statu_cat(df, index)
+        export_neighborhood_codes(df_metropol, output_dir / "metropol.txt")
+        export_neighborhood_codes(df_other, output_dir / "other.txt")
+
+    previous = None
+    if state_path is not None and os.path.exists(state_path):
+        with open(state_path, 'rb') as f:
+            previous = pickle.load(f)
+    results = run_final_sampling(df, sampling_frame, index, seed, districts_per_cell=districts_per_cell,
+                                 incremental=state_path is not None, previous=previous)
+    if state_path is not None:
+        atomic_write_bytes(state_path, pickle.dumps(results['state']))
+        logger.info("Redrew %d strata; state saved to %s", len(results['redrawn']), state_path)
+    write_archive({
+        "final_sample.xlsx": results['final_sample'],
+        "sample_plan_vs_actual.xlsx": results['plan_comparison'],
+    }, output_dir / "final_sampling_outputs.zip", fmt)
+
+    results.update(population_distribution=population_distribution, sampling_frame=sampling_frame)
+    return results
+
+
+def run_streamed_phase1(config, total_sample_size, interviews_per_neighborhood, data_path, output_dir, fmt='xlsx',
+                        method='proportional', min_per_stratum=0, chunk_rows=None):
+    """Phase 1 only, for CSV datasets too large to load: the plan plus rows and population per stratum."""
+    population_distribution, sampling_frame, summary = build_streamed_plan(
+        data_path, config, total_sample_size, interviews_per_neighborhood, method, min_per_stratum, chunk_rows)
+    write_archive({
+        "population_distribution.xlsx": population_distribution,
+        "sampling_frame.xlsx": sampling_frame,
+        "strata.xlsx": summary['strata'],
+    }, Path(output_dir) / "sampling_outputs.zip", fmt)
+    return {'population_distribution': population_distribution, 'sampling_frame': sampling_frame,
+            'strata': summary['strata'], 'rows': summary['rows']}
+
+
+def write_diagnostics(recorder, args):
+    """Save or print what the recorder collected, as asked for on the command line."""
+    if args.metrics:
+        recorder.write_json(args.metrics)
+    if args.trace:
+        recorder.write_trace(args.trace)
+    if args.profile and args.profile_output:
+        recorder.write_profile(args.profile_output)
+    elif args.profile:
+        print(recorder.profile_text(), file=sys.stderr)
+    if not args.metrics:
+        print(recorder.summary_frame().to_string(index=False), file=sys.stderr)
+        print(recorder.counters_frame().to_string(index=False), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the stratified sampling pipeline (Phases 1-4) headless.")
+    parser.add_argument('--config', default='config.yaml', help="Path to config.yaml.")
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help="ADNKS dataset (Excel or CSV).")
+    parser.add_argument('--sample-size', type=int, required=True, help="Total number of interviews.")
+    parser.add_argument('--per-neighborhood', type=int, required=True, help="Interviews per neighborhood.")
+    parser.add_argument('--metropol', help="Metropol provinces (Phase 2): CSV or Excel with a NUTS3KODU column, "
+                                           "or a .txt of codes.")
+    parser.add_argument('--other', help="Other provinces (Phase 2), in the same formats as --metropol.")
+    parser.add_argument('--allocation', default='proportional', choices=ALLOCATION_METHODS,
+                        help="How interviews are split over Groups (Neyman uses neighborhood population spread).")
+    parser.add_argument('--min-per-group', type=int, default=0, help="Minimum interviews for every Group.")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed for Phase 3.")
+    parser.add_argument('--districts-per-cell', type=int, default=1,
+                        help="Districts drawn in each Other Group x ILCE_STATU cell before drawing neighborhoods.")
+    parser.add_argument('--incremental', metavar='STATE',
+                        help="Draw with permanent random numbers and redraw only the strata that changed since the "
+                             "run saved in this file (created if missing).")
+    parser.add_argument('--output-dir', default='outputs', help="Directory for the generated files.")
+    parser.add_argument('--format', default='xlsx', choices=OUTPUT_FORMATS, help="Format of the tables inside the ZIPs.")
+    parser.add_argument('--chunk-rows', type=int,
+                        help="Stream a CSV dataset in chunks of this many rows and run Phase 1 only, "
+                             "for datasets larger than memory.")
+    parser.add_argument('--metrics', help="Write per-function timings, row counts and cache hits to this JSON file.")
+    parser.add_argument('--trace', help="Write a Chrome trace-event file (chrome://tracing, Perfetto) of the run.")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Record memory deltas per function with tracemalloc (slower).")
+    parser.add_argument('--profile', choices=PROFILERS, help="Profile the whole run with cProfile or pyinstrument.")
+    parser.add_argument('--profile-output', help="Where to save the profile (.prof for cProfile, .html for "
+                                                 "pyinstrument); printed to stderr otherwise.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log progress messages, not just warnings.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(levelname)s %(name)s: %(message)s')
+    logging.getLogger(LOGGER_NAME).setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    if (args.metropol is None) != (args.other is None):
+        parser.error("--metropol and --other must be given together")
+    if args.chunk_rows is not None and args.metropol:
+        parser.error("--chunk-rows runs Phase 1 only; it cannot be combined with --metropol/--other")
+    if args.chunk_rows is not None and args.incremental:
+        parser.error("--chunk-rows runs Phase 1 only; it cannot be combined with --incremental")
+
+    from phase2_neighborhood_selection import read_nuts3_codes
+
+    recorder = None
+    if args.metrics or args.trace or args.trace_memory or args.profile:
+        recorder = Recorder(memory=args.trace_memory, profile=args.profile)
+    try:
+        with recorder or contextlib.nullcontext():
+            config = load_config(args.config)
+            metropol_nuts3 = read_nuts3_codes(args.metropol) if args.metropol else None
+            other_nuts3 = read_nuts3_codes(args.other) if args.other else None
+            results = run_pipeline(config, args.sample_size, args.per_neighborhood, data_path=args.data,
+                                   metropol_nuts3=metropol_nuts3, other_nuts3=other_nuts3,
+                                   seed=args.seed, output_dir=args.output_dir, fmt=args.format,
+                                   method=args.allocation, min_per_stratum=args.min_per_group,
+                                   chunk_rows=args.chunk_rows, districts_per_cell=args.districts_per_cell,
+                                   state_path=args.incremental)
+    except SamplingError as e:
+        logger.error("%s", e)
+        return 1
+
+    if recorder is not None:
+        write_diagnostics(recorder, args)
+
+    if args.chunk_rows:
+        print(f"Streamed {results['rows']} rows")
+        print(results['sampling_frame'].to_string(index=False))
+    else:
+        print(results['plan_comparison'].to_string(index=False))
+    print(f"Outputs written to {args.output_dir}/")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
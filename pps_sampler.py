@@ -0,0 +1,131 @@
+# pps_sampler.py
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+
+
+def pareto_keys(inclusion, rng, uniforms=None):
+    """Pareto πps keys logit(λ) - logit(u); the n largest keys in a stratum form its draw.
+
+    `inclusion` holds the target probabilities λ from pps_inclusion. The
+    draw's inclusion probabilities match λ to within sampling noise, and
+    units with λ = 1 get an infinite key, so certainty units are always
+    drawn. `uniforms` replaces the draws from `rng`, e.g. with permanent
+    random numbers.
+    """
+    u = rng.random(len(inclusion)) if uniforms is None else uniforms
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keys = np.log(inclusion / (1.0 - inclusion)) - np.log(u / (1.0 - u))
+    keys[inclusion >= 1] = np.inf
+    keys[inclusion <= 0] = -np.inf
+    return keys
+
+
+def top_n_per_stratum(strata, keys, sizes):
+    """Positions of the `sizes[s]` largest keys in every stratum `s`, in one sort.
+
+    `strata` holds integer stratum ids (negative ids are never selected).
+    The result is ordered by stratum id, then by descending key, i.e. draw order.
+    """
+    candidates = np.flatnonzero(strata >= 0)
+    order = np.lexsort((-keys[candidates], strata[candidates]))
+    positions = candidates[order]
+    sorted_strata = strata[positions]
+
+    starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+    counts = np.diff(np.r_[starts, len(positions)])
+    rank = np.arange(len(positions)) - np.repeat(starts, counts)
+    return positions[rank < sizes[sorted_strata]]
+
+
+def pps_inclusion(strata, weights, sizes):
+    """First-order inclusion probabilities of a PPS draw of `sizes[s]` units in every stratum `s`.
+
+    Each unit gets n_s * w_i / W_s. Units that would exceed one are taken
+    with certainty and the rest of the stratum's sample is spread over the
+    others, until no probability exceeds one. Negative strata and
+    non-positive weights get zero. pareto_keys draws with these probabilities.
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    eligible = (strata >= 0) & (weights > 0)
+    labels = np.where(eligible, strata, 0)
+    certain = np.zeros(len(strata), dtype=bool)
+    probabilities = np.zeros(len(strata))
+    while True:
+        open_units = eligible & ~certain
+        left = sizes - np.bincount(labels[certain], minlength=len(sizes))
+        weight_left = np.bincount(labels[open_units], weights=weights[open_units], minlength=len(sizes))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            probabilities[open_units] = (left / weight_left)[labels[open_units]] * weights[open_units]
+        newly_certain = open_units & (probabilities >= 1)
+        if not newly_certain.any():
+            break
+        certain |= newly_certain
+    probabilities[certain] = 1.0
+    return probabilities
+
+
+def permanent_random_numbers(values, seed):
+    """A uniform (0, 1] number per value that depends only on the value and `seed` (splitmix64 of the value).
+
+    Integer values are used as they are; anything else (e.g. district names)
+    is hashed first.
+    """
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.integer):
+        values = pd.util.hash_array(values.astype(object))
+    key = np.random.SeedSequence(seed).generate_state(1, np.uint64)[0]
+    x = values.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + key
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return ((x >> np.uint64(11)).astype(float) + 1.0) / 2.0**53
+
+
+def pps_sample_by_stratum(df, by, sizes, rng, weight='population', eligible=None):
+    """Draw PPS samples without replacement for every stratum of `df` at once.
+
+    `sizes` is a Series indexed by stratum label with the number of units to
+    draw; `eligible` optionally restricts the draw to a boolean row mask.
+    Units with non-positive weight are never drawn, so each stratum yields at
+    most as many rows as it has units with positive weight.
+    """
+    sizes = sizes[sizes > 0]
+    strata = pd.Categorical(df[by], categories=sizes.index).codes.astype(np.int64)
+    weights = df[weight].to_numpy(dtype=float)
+    strata[~(weights > 0)] = -1
+    if eligible is not None:
+        strata[~np.asarray(eligible)] = -1
+
+    sizes = sizes.to_numpy(dtype=np.int64)
+    keys = pareto_keys(pps_inclusion(strata, weights, sizes), rng)
+    positions = top_n_per_stratum(strata, keys, sizes)
+    return df.iloc[positions]
+
+
+@instrumented
+def pps_sample_rows(row_groups, sizes, weights, rng, probabilities=False, prn=None):
+    """PPS draw without replacement from precomputed per-stratum row positions.
+
+    `row_groups[i]` holds the positions of stratum i and `sizes[i]` its sample
+    size; only the listed rows are touched, never the whole frame. With
+    `probabilities`, also returns each drawn row's inclusion probability
+    (see pps_inclusion). With `prn` (a permanent random number per row of
+    `weights`), the draw uses those instead of `rng` and is the same every
+    time for the same rows and sizes.
+    """
+    if not row_groups:
+        empty = np.empty(0, dtype=np.intp)
+        return (empty, np.empty(0)) if probabilities else empty
+    positions = np.concatenate(row_groups)
+    strata = np.repeat(np.arange(len(row_groups)), [len(rows) for rows in row_groups])
+    unit_weights = weights[positions].astype(float)
+    strata[~(unit_weights > 0)] = -1
+
+    sizes = np.asarray(sizes, dtype=np.int64)
+    inclusion = pps_inclusion(strata, unit_weights, sizes)
+    drawn = top_n_per_stratum(strata, pareto_keys(inclusion, rng, None if prn is None else prn[positions]), sizes)
+    if probabilities:
+        return positions[drawn], inclusion[drawn]
+    return positions[drawn]
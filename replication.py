@@ -0,0 +1,159 @@
+# replication.py
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from phase3_sampler import design_inclusion, draw_metropol_positions, draw_other_positions
+from stratum_index import build_stratum_index
+
+# Per-worker state, set once by _init_worker so tasks only carry seeds
+_STATE = {}
+# Expected selections (and non-selections) a unit needs before its inclusion rate is tested
+MIN_EXPECTED = 10
+
+
+def _init_worker(index, sampling_frame, weights, group_codes, n_groups, districts_per_cell):
+    _STATE.update(index=index, sampling_frame=sampling_frame, weights=weights,
+                  group_codes=group_codes, n_groups=n_groups, districts_per_cell=districts_per_cell)
+
+
+def _run_batch(seed_sequences):
+    """Run one Phase 3 draw per seed and return summed counts for the batch."""
+    index, frame, weights = _STATE['index'], _STATE['sampling_frame'], _STATE['weights']
+    group_codes, n_groups = _STATE['group_codes'], _STATE['n_groups']
+
+    selections = np.zeros(index['n_rows'], dtype=np.int64)
+    group_sizes = np.empty((len(seed_sequences), n_groups), dtype=np.int64)
+    shortfalls = {}
+    for r, seed_seq in enumerate(seed_sequences):
+        rng = np.random.default_rng(seed_seq)
+        metropol = draw_metropol_positions(index, frame, weights, rng)
+        other, cell_shortfalls = draw_other_positions(index, frame, weights, rng,
+                                                      districts_per_cell=_STATE['districts_per_cell'])
+        positions = np.concatenate([metropol, other])
+
+        selections[positions] += 1
+        group_sizes[r] = np.bincount(group_codes[positions], minlength=n_groups)
+        for group, ilce_status, _, _ in cell_shortfalls:
+            shortfalls[(group, ilce_status)] = shortfalls.get((group, ilce_status), 0) + 1
+    return selections, group_sizes, shortfalls
+
+
+def run_replications(df, sampling_frame, n_replicates, seed=None, workers=None, batch_size=None, index=None,
+                     districts_per_cell=1):
+    """Run `n_replicates` independent Phase 3 draws and summarize the design.
+
+    Every replicate gets its own stream spawned from one SeedSequence, so
+    results depend only on `seed` and `n_replicates`, not on the worker
+    count. Returns a dict of DataFrames: per-neighborhood inclusion
+    frequencies next to their design probabilities (see design_inclusion)
+    with a z-score for the difference where at least MIN_EXPECTED
+    selections and non-selections are expected, per-Group realized sample sizes,
+    and how often a chosen district had fewer neighborhoods than its share.
+    """
+    if index is None:
+        index = build_stratum_index(df)
+    workers = workers or os.cpu_count() or 1
+    batch_size = batch_size or max(1, min(100, -(-n_replicates // (workers * 4))))
+
+    groups = pd.Categorical(df['Group'])
+    group_codes = groups.codes.astype(np.intp)
+    initargs = (index, sampling_frame, df['population'].to_numpy(), group_codes, len(groups.categories),
+                districts_per_cell)
+
+    seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+    batches = [seeds[i:i + batch_size] for i in range(0, n_replicates, batch_size)]
+
+    selections = np.zeros(len(df), dtype=np.int64)
+    group_sizes, shortfalls = [], {}
+    if workers == 1:
+        _init_worker(*initargs)
+        results = map(_run_batch, batches)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs)
+        results = pool.map(_run_batch, batches)
+    try:
+        for batch_selections, batch_group_sizes, batch_shortfalls in results:
+            selections += batch_selections
+            group_sizes.append(batch_group_sizes)
+            for key, count in batch_shortfalls.items():
+                shortfalls[key] = shortfalls.get(key, 0) + count
+    finally:
+        if workers != 1:
+            pool.shutdown()
+
+    inclusion = df[['neighborhood_code', 'Group', 'STATU_CAT', 'status', 'nuts3', 'district', 'population']].copy()
+    inclusion['selections'] = selections
+    inclusion['inclusion_rate'] = selections / n_replicates
+    design = design_inclusion(index, sampling_frame, initargs[2], districts_per_cell)
+    inclusion['Inclusion_Probability'] = design
+    # The normal approximation only holds with enough expected selections; certain units must always be drawn
+    standard_error = np.sqrt(design * (1 - design) / n_replicates)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(standard_error > 0, (inclusion['inclusion_rate'] - design) / standard_error,
+                     np.where(inclusion['inclusion_rate'] == design, 0.0, np.inf))
+    testable = (np.minimum(design, 1 - design) * n_replicates >= MIN_EXPECTED) | (design == 1)
+    inclusion['z'] = np.where(testable, z, np.nan)
+    inclusion = inclusion[(inclusion['selections'] > 0) | (design > 0)].reset_index(drop=True)
+
+    sizes = pd.DataFrame(np.vstack(group_sizes), columns=groups.categories)
+    planned = sampling_frame.set_index(sampling_frame['Group'].astype(object))['Neighborhood_Count']
+    group_summary = pd.DataFrame({
+        'Planned': planned.reindex(sizes.columns).fillna(0).astype(int),
+        'Mean': sizes.mean(),
+        'Variance': sizes.var(ddof=1) if n_replicates > 1 else 0.0,
+        'Min': sizes.min(),
+        'Max': sizes.max(),
+    }).rename_axis('Group').reset_index()
+
+    shortfall_summary = pd.DataFrame(
+        [(group, status, count, count / n_replicates) for (group, status), count in sorted(shortfalls.items())],
+        columns=['Group', 'status', 'shortfalls', 'rate'],
+    )
+    return {'inclusion': inclusion, 'group_sizes': group_summary, 'shortfalls': shortfall_summary}
+
+
+def main(argv=None):
+    from data_cache import load_cached_data
+    from sampling_frame import create_population_distribution, compute_sampling_frame
+    from utils import load_config
+
+    parser = argparse.ArgumentParser(description="Monte Carlo replication of the Phase 3 sampling design.")
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--data', default='ADNKS_2023.xlsx')
+    parser.add_argument('--sample-size', type=int, default=1000)
+    parser.add_argument('--per-neighborhood', type=int, default=10)
+    parser.add_argument('--replicates', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--districts-per-cell', type=int, default=1)
+    parser.add_argument('--output-dir', default='replication_outputs')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    df = load_cached_data(args.data, config)
+    sampling_frame = compute_sampling_frame(create_population_distribution(df, config),
+                                            args.sample_size, args.per_neighborhood)
+
+    start = time.perf_counter()
+    results = run_replications(df, sampling_frame, args.replicates, seed=args.seed, workers=args.workers,
+                               districts_per_cell=args.districts_per_cell)
+    elapsed = time.perf_counter() - start
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, table in results.items():
+        table.to_csv(os.path.join(args.output_dir, f"{name}.csv"), index=False)
+    print(f"{args.replicates} replicates in {elapsed:.1f}s -> {args.output_dir}/")
+    print(results['group_sizes'].to_string(index=False))
+    z = results['inclusion']['z'].dropna().abs()
+    if len(z):
+        print(f"Inclusion check (rate vs design probability): {len(z)} units, max |z| {z.max():.2f}, "
+              f"{(z > 3).mean():.2%} beyond 3 (sampling noise alone gives about 0.27%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,24 @@
 import pandas as pd
-import streamlit as st
+
+from allocation import allocate_frame
+from conditions import adjustment_populations, compile_condition, evaluate_plan
+from instrumentation import instrumented
+from utils import SamplingError, get_logger
+
+logger = get_logger(__name__)
 
 def eval_condition(condition, df, config):
     try:
-        col_map = {v: k for k, v in config['columns'].items()}
-        parts = condition.split(' and ')
-        mask = pd.Series(True, index=df.index)
-        for part in parts:
-            field, value = part.split('==')
-            field = col_map.get(field.strip(), field.strip())
-            value = value.strip().strip("'").strip('"')
-            mask &= df[field] == value
-        return mask
+        mask = evaluate_plan(compile_condition(condition, config), df)[0]
     except Exception as e:
-        st.error(f"Error evaluating condition '{condition}': {str(e)}")
+        logger.error("Error evaluating condition '%s': %s", condition, e)
         return pd.Series(False, index=df.index)
+    return pd.Series(mask, index=df.index)
 
+@instrumented
 def create_population_distribution(df, config):
     try:
-        adjustments = {}
-        for adj in config['special_adjustments']:
-            stratum = adj['stratum']
-            condition = adj['condition']
-            if adj['action'] == 'add_population':
-                pop = df[eval_condition(condition, df, config)]['population'].sum()
-                adjustments[stratum] = pop
+        adjustments = adjustment_populations(df, config)
 
         table = pd.pivot_table(
             df,
@@ -34,7 +28,15 @@ def create_population_distribution(df, config):
             aggfunc='sum',
             fill_value=0
         ).reset_index()
+    except SamplingError:
+        raise
+    except Exception as e:
+        raise SamplingError(f"Error creating population distribution: {str(e)}") from e
+    return distribution_table(table, adjustments)
 
+def distribution_table(table, adjustments):
+    """Finish a Group x STATU_CAT population table: both status columns, adjustments and Total_Pop."""
+    try:
         if 'M&D' not in table.columns:
             table['M&D'] = 0
         if 'BŞ' not in table.columns:
@@ -48,29 +50,24 @@ def create_population_distribution(df, config):
         return table.sort_values('Group').reset_index(drop=True)
 
     except Exception as e:
-        st.error(f"Error creating population distribution: {str(e)}")
-        st.stop()
+        raise SamplingError(f"Error creating population distribution: {str(e)}") from e
 
-def compute_sampling_frame(population_distribution, total_sample_size, interviews_per_neighborhood):
-    import numpy as np
-    try:
-        frame = population_distribution.copy()
-
-        total_pop = frame['Total_Pop'].sum()
-        if total_pop == 0:
-            st.error("Total population is zero.")
-            st.stop()
+def population_dispersion(df, groups=None):
+    """Standard deviation of neighborhood population per Group, the S_h used by Neyman allocation."""
+    dispersion = df.groupby('Group', observed=True)['population'].std(ddof=0).fillna(0)
+    return dispersion if groups is None else dispersion.reindex(groups).fillna(0).to_numpy()
 
-        frame['Sample_Size'] = (frame['Total_Pop'] / total_pop * total_sample_size).round().astype(int)
-        diff = total_sample_size - frame['Sample_Size'].sum()
-        if diff != 0:
-            frame.loc[frame['Sample_Size'].idxmax(), 'Sample_Size'] += diff
+@instrumented
+def compute_sampling_frame(population_distribution, total_sample_size, interviews_per_neighborhood,
+                           method='proportional', dispersion=None, min_per_stratum=0):
+    total_pop = population_distribution['Total_Pop'].sum()
+    if total_pop == 0:
+        raise SamplingError("Total population is zero.")
 
-        frame['Neighborhood_Count'] = (frame['Sample_Size'] / interviews_per_neighborhood).apply(np.ceil).astype(int)
-        frame['Neighborhood_BŞ'] = ((frame.get('BŞ', 0) / frame['Total_Pop']) * frame['Neighborhood_Count']).round().astype(int)
-        frame['Neighborhood_M&D'] = frame['Neighborhood_Count'] - frame['Neighborhood_BŞ']
-
-        return frame
+    try:
+        return allocate_frame(population_distribution, total_sample_size, interviews_per_neighborhood,
+                              method=method, dispersion=dispersion, min_per_stratum=min_per_stratum)
+    except SamplingError:
+        raise
     except Exception as e:
-        st.error(f"Error computing sampling frame: {str(e)}")
-        st.stop()
+        raise SamplingError(f"Error computing sampling frame: {str(e)}") from e
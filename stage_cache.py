@@ -0,0 +1,51 @@
+# stage_cache.py
+import time
+from collections import OrderedDict
+
+from instrumentation import count, span
+
+
+class StageCache:
+    """Memoizes pipeline stages by their exact inputs and records what ran.
+
+    Each stage is identified by a name and a hashable key built from its
+    inputs (parameters plus the keys of the stages it depends on), so a
+    change upstream changes every downstream key and only those stages
+    recompute. `log` holds one entry per stage call since `start_run()`.
+    A `valid` predicate passed to run() rejects a cached value that has gone
+    stale outside the cache (e.g. a file deleted by another session), which
+    is then recomputed.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.log = []
+
+    def start_run(self):
+        self.log = []
+
+    def run(self, name, key, fn, *args, valid=None, **kwargs):
+        cache_key = (name, key)
+        start = time.perf_counter()
+        if valid is not None and cache_key in self._entries and not valid(self._entries[cache_key]):
+            del self._entries[cache_key]
+        cached = cache_key in self._entries
+        count(f"stage:{name}", hit=cached)
+        if cached:
+            self._entries.move_to_end(cache_key)
+            value = self._entries[cache_key]
+        else:
+            with span(f"stage:{name}"):
+                value = fn(*args, **kwargs)
+            self._entries[cache_key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self.log.append({'stage': name, 'cached': cached, 'seconds': time.perf_counter() - start})
+        return value
+
+    def get(self, name, key, default=None):
+        return self._entries.get((name, key), default)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,95 @@
+# stratum_index.py
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+
+LEVELS = ('Group', 'STATU_CAT', 'status', 'nuts3', 'district')
+
+
+@instrumented
+def build_stratum_index(df, levels=LEVELS):
+    """Index every prefix of Group -> STATU_CAT -> status -> nuts3 -> district in one sort.
+
+    Rows are ordered by all levels at once, so each stratum (at any depth) is
+    a contiguous slice of `order`; lookups return views and population totals
+    come from a cumulative sum. Keys are tuples such as ('TR2',),
+    ('TR2', 'M&D') or ('TR2', 'M&D', 2, 'TR221', 'Merkez'); district names
+    repeat across provinces (every central district is 'Merkez'), so a
+    district is only identified together with its NUTS3 code.
+
+    The deepest strata (districts) are also kept as arrays: their level codes
+    into `uniques`, and their slice bounds, so a draw over every district at
+    once needs no per-key lookups.
+    """
+    codes, uniques = [], []
+    for col in levels:
+        col_codes, col_uniques = pd.factorize(df[col], sort=True, use_na_sentinel=False)
+        codes.append(col_codes)
+        uniques.append(col_uniques)
+
+    order = np.lexsort(codes[::-1]) if len(df) else np.empty(0, dtype=np.intp)
+    sorted_codes = [col_codes[order] for col_codes in codes]
+    population = df['population'].to_numpy()[order]
+
+    slices = {}
+    children = {(): []}
+    boundary = np.zeros(len(order), dtype=bool)
+    if len(order):
+        boundary[0] = True
+    for depth, level_codes in enumerate(sorted_codes):
+        boundary[1:] |= level_codes[1:] != level_codes[:-1]
+        starts = np.flatnonzero(boundary)
+        stops = np.r_[starts[1:], len(order)]
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            key = tuple(uniques[level][sorted_codes[level][start]] for level in range(depth + 1))
+            slices[key] = (start, stop)
+            children.setdefault(key[:-1], []).append(key[-1])
+            if depth + 1 < len(levels):
+                children.setdefault(key, [])
+    leaf_starts = np.flatnonzero(boundary)
+
+    return {
+        'levels': tuple(levels),
+        'n_rows': len(df),
+        'order': order,
+        'cum_population': np.r_[0, np.cumsum(population)],
+        'slices': slices,
+        'children': children,
+        'uniques': uniques,
+        'leaf_codes': np.column_stack([level_codes[leaf_starts] for level_codes in sorted_codes]),
+        'leaf_starts': leaf_starts,
+        'leaf_stops': np.r_[leaf_starts[1:], len(order)].astype(np.intp),
+    }
+
+
+def stratum_rows(index, *key):
+    """Row positions (into the indexed frame) of the stratum `key`; empty if absent."""
+    if not key:
+        return index['order']
+    start, stop = index['slices'].get(tuple(key), (0, 0))
+    return index['order'][start:stop]
+
+
+def stratum_population(index, *key):
+    if not key:
+        return index['cum_population'][-1]
+    start, stop = index['slices'].get(tuple(key), (0, 0))
+    return index['cum_population'][stop] - index['cum_population'][start]
+
+
+def stratum_children(index, *key):
+    """Sorted next-level values present under `key`, e.g. the districts of a status cell."""
+    return index['children'].get(tuple(key), [])
+
+
+def leaf_population(index):
+    """Population of every deepest stratum, aligned with index['leaf_codes']."""
+    cum_population = index['cum_population']
+    return cum_population[index['leaf_stops']] - cum_population[index['leaf_starts']]
+
+
+def union_rows(index, keys):
+    """Sorted row positions covered by any of the stratum `keys`."""
+    parts = [stratum_rows(index, *key) for key in keys]
+    return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
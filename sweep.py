@@ -0,0 +1,113 @@
+# sweep.py
+"""What-if sweep of the sampling frame over a grid of sample sizes and interviews per neighborhood.
+
+The whole grid is allocated at once. Every sample size is one row of a
+single largest-remainder call over the Groups, and every (sample size,
+interviews, Group) cell is one row of a single BŞ/M&D split. Each grid
+point therefore gets the plan compute_sampling_frame would produce, without
+a loop over settings.
+
+Usage:
+    python sweep.py --sample-sizes 500 1000 1500 2000 --interviews 8 10 12 [--output sweep.csv]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from allocation import ALLOCATION_METHODS, allocate, allocation_quotas, allocation_weights
+from instrumentation import instrumented
+from utils import SamplingError
+
+SWEEP_MEASURES = ('Neighborhood_Count', 'Neighborhood_BŞ', 'Neighborhood_M&D', 'Fielded_Interviews',
+                  'Extra_Interviews', 'Max_Rounding_Error')
+
+
+@instrumented
+def sweep_frames(population_distribution, sample_sizes, interviews, method='proportional', dispersion=None,
+                 min_per_stratum=0):
+    """One row per (Total_Sample_Size, Interviews_per_Neighborhood, Group) with that grid point's plan.
+
+    Alongside the sampling frame columns: Quota (the unrounded allocation),
+    Rounding_Error (Sample_Size - Quota), Fielded_Interviews
+    (Neighborhood_Count * interviews) and Extra_Interviews (fielded beyond
+    Sample_Size because neighborhoods are whole).
+    """
+    sizes = np.unique(np.asarray(sample_sizes, dtype=np.int64))
+    per_neighborhood = np.unique(np.asarray(interviews, dtype=np.int64))
+    if len(sizes) == 0 or len(per_neighborhood) == 0:
+        raise SamplingError("The sweep needs at least one sample size and one interviews-per-neighborhood value.")
+    if sizes.min() <= 0 or per_neighborhood.min() <= 0:
+        raise SamplingError("Sample sizes and interviews per neighborhood must be positive.")
+    if population_distribution['Total_Pop'].sum() == 0:
+        raise SamplingError("Total population is zero.")
+
+    groups = population_distribution['Group'].to_numpy()
+    weights = np.broadcast_to(allocation_weights(population_distribution['Total_Pop'].to_numpy(), method, dispersion),
+                              (len(sizes), len(groups)))
+    sample_size = allocate(weights, sizes, minimum=min_per_stratum)                 # (sizes, groups)
+    quota = allocation_quotas(weights, sizes, minimum=min_per_stratum)
+    count = -(-sample_size[:, None, :] // per_neighborhood[None, :, None])          # (sizes, interviews, groups)
+
+    status_pop = np.column_stack([population_distribution[col].to_numpy() if col in population_distribution.columns
+                                  else np.zeros(len(groups)) for col in ('BŞ', 'M&D')])
+    split = allocate(np.tile(status_pop, (len(sizes) * len(per_neighborhood), 1)), count.ravel())
+
+    grid_size, grid_interviews, _ = np.meshgrid(sizes, per_neighborhood, np.arange(len(groups)), indexing='ij')
+    shape = count.shape
+    sweep = pd.DataFrame({
+        'Total_Sample_Size': grid_size.ravel(),
+        'Interviews_per_Neighborhood': grid_interviews.ravel(),
+        'Group': np.tile(groups, len(sizes) * len(per_neighborhood)),
+        'Sample_Size': np.broadcast_to(sample_size[:, None, :], shape).ravel(),
+        'Quota': np.broadcast_to(quota[:, None, :], shape).ravel(),
+        'Neighborhood_Count': count.ravel(),
+        'Neighborhood_BŞ': split[:, 0],
+        'Neighborhood_M&D': split[:, 1],
+    })
+    sweep['Rounding_Error'] = sweep['Sample_Size'] - sweep['Quota']
+    sweep['Fielded_Interviews'] = sweep['Neighborhood_Count'] * sweep['Interviews_per_Neighborhood']
+    sweep['Extra_Interviews'] = sweep['Fielded_Interviews'] - sweep['Sample_Size']
+    return sweep
+
+
+def sweep_summary(sweep):
+    """Totals per grid point: neighborhoods, fielded and extra interviews, and the largest Group rounding error."""
+    grid = ['Total_Sample_Size', 'Interviews_per_Neighborhood']
+    summary = sweep.groupby(grid)[['Neighborhood_Count', 'Neighborhood_BŞ', 'Neighborhood_M&D',
+                                   'Fielded_Interviews', 'Extra_Interviews']].sum()
+    summary['Max_Rounding_Error'] = sweep['Rounding_Error'].abs().groupby([sweep[col] for col in grid]).max()
+    return summary.reset_index()
+
+
+def main(argv=None):
+    from pipeline import load_dataset
+    from sampling_frame import create_population_distribution, population_dispersion
+    from utils import load_config
+
+    parser = argparse.ArgumentParser(description="Sampling frames for a grid of sample sizes and interviews.")
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--data', default='ADNKS_2023.xlsx')
+    parser.add_argument('--sample-sizes', type=int, nargs='+', required=True)
+    parser.add_argument('--interviews', type=int, nargs='+', required=True, help="Interviews per neighborhood.")
+    parser.add_argument('--allocation', default='proportional', choices=ALLOCATION_METHODS)
+    parser.add_argument('--min-per-group', type=int, default=0)
+    parser.add_argument('--output', help="Write the per-Group sweep to this CSV file.")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    df = load_dataset(config, args.data)
+    population_distribution = create_population_distribution(df, config)
+    dispersion = None
+    if args.allocation == 'neyman':
+        dispersion = population_dispersion(df, population_distribution['Group'])
+    sweep = sweep_frames(population_distribution, args.sample_sizes, args.interviews, args.allocation, dispersion,
+                         args.min_per_group)
+    if args.output:
+        sweep.to_csv(args.output, index=False, encoding='utf-8')
+        print(f"Sweep written to {args.output}")
+    print(sweep_summary(sweep).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
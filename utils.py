@@ -1,21 +1,102 @@
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import yaml
-import streamlit as st
+
+LOGGER_NAME = 'sampling'
+
+class SamplingError(Exception):
+    """A problem with the inputs or configuration that stops the pipeline."""
+
+def get_logger(name):
+    """Module logger under the shared 'sampling' namespace, so the UI and CLI can attach one handler."""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+logger = get_logger(__name__)
+
+# The process umask, read once at import (os.umask can only read it by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
 def load_config(config_path='config.yaml'):
+    import yaml  # deferred: only needed once per process, when the config is read
+
     try:
         with open(config_path, 'r') as file:
             config = yaml.safe_load(file)
-        if not config:
-            st.error("Configuration file is empty or invalid.")
-            st.stop()
-        return config
     except FileNotFoundError:
-        st.error(f"Configuration file not found: {config_path}")
-        st.stop()
+        raise SamplingError(f"Configuration file not found: {config_path}") from None
     except yaml.YAMLError as e:
-        st.error(f"Error parsing configuration file: {str(e)}")
-        st.stop()
+        raise SamplingError(f"Error parsing configuration file: {str(e)}") from e
+    if not config:
+        raise SamplingError("Configuration file is empty or invalid.")
+    return config
+
+def atomic_write_bytes(path, data):
+    """Write `data` to `path` via a unique temp file and os.replace, so readers never see a partial file."""
+    atomic_write_chunks(path, (data,))
+
+def atomic_write_chunks(path, chunks):
+    """Like atomic_write_bytes, but streams an iterable of byte chunks instead of one buffer."""
+    with atomic_open(path) as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+@contextlib.contextmanager
+def atomic_open(path):
+    """A binary file object whose contents replace `path` only once the block exits without an error.
+
+    mkstemp creates the temp file owner-only; it is given the mode open()
+    would have (0666 less the umask) before it replaces `path`.
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.chmod(tmp_name, 0o666 & ~_UMASK)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def memory_footprint(obj, exclude=(), _seen=None):
+    """Approximate bytes held by `obj`, following containers and object attributes.
+
+    Anything reachable from `exclude` (e.g. the shared base frame) is not
+    counted, and NumPy views are counted once, through the array that owns
+    their buffer.
+    """
+    if _seen is None:
+        _seen = set()
+        for shared in exclude:
+            memory_footprint(shared, _seen=_seen)
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(obj, pd.DataFrame) else usage)
+    if isinstance(obj, np.ndarray):
+        owner = obj
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        if owner is not obj:
+            return memory_footprint(owner, _seen=_seen)
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = [part for pair in obj.items() for part in pair]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = list(obj)
+    else:
+        items = list(vars(obj).values()) if hasattr(obj, '__dict__') else []
+    return size + sum(memory_footprint(item, _seen=_seen) for item in items)
 
 def assign_group(row):
     try:
@@ -40,7 +121,7 @@ def assign_group(row):
         return nuts1
 
     except Exception as e:
-        st.error(f"Error assigning group for row: {str(e)}")
+        logger.error("Error assigning group for row: %s", e)
         return None
 
 def classify_statut(stat):
@@ -51,5 +132,28 @@ def classify_statut(stat):
             return 'M&D'
         return 'Other'
     except Exception as e:
-        st.error(f"Error classifying status: {str(e)}")
-        return 'Other'
\ No newline at end of file
+        logger.error("Error classifying status: %s", e)
+        return 'Other'
+
+def classify_statuses(status):
+    """Vectorized classify_statut: returns a categorical Series aligned with `status`."""
+    codes = np.select([status.eq(0).to_numpy(), status.isin([1, 2]).to_numpy()], [0, 1], default=2).astype(np.int8)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=['BŞ', 'M&D', 'Other']), index=status.index)
+
+def assign_groups(df):
+    """Vectorized assign_group via a lookup over the distinct NUTS1/2/3 combinations.
+
+    assign_group only depends on the NUTS codes, so it is evaluated once per
+    distinct (nuts1, nuts2, nuts3) triple and broadcast back to the rows.
+    """
+    nuts_cols = ['nuts1', 'nuts2', 'nuts3']
+    factorized = [pd.factorize(df[col], use_na_sentinel=False) for col in nuts_cols]
+    dims = [max(len(uniques), 1) for _, uniques in factorized]
+    combined = np.ravel_multi_index([codes for codes, _ in factorized], dims)
+    codes, keys = pd.factorize(combined)
+    uniques = [values for _, values in factorized]
+    groups = pd.Categorical([
+        assign_group({col: values[code] for col, values, code in zip(nuts_cols, uniques, key)})
+        for key in zip(*np.unravel_index(keys, dims))
+    ])
+    return pd.Series(pd.Categorical.from_codes(groups.codes[codes], groups.categories), index=df.index)